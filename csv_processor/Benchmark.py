@@ -0,0 +1,177 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from .DataFile import DataFile, RelationshipIndex
+from .Filter import Filter
+
+#formats of the numeric values written by generate_csv
+NUMBER_FORMATS = {
+    "plain": lambda number: f"{number:.0f}",
+    "decimal": lambda number: f"{number:.2f}",
+    "thousands": lambda number: f"{number:,.0f}",
+    "currency": lambda number: f"${number:,.0f}",
+}
+#value written for a missing number
+MISSING_VALUE = "N.A."
+'''
+    Write a synthetic csv file and return its list of headers.
+
+    rows: number of data rows
+    columns: number of columns
+    numeric_ratio: fraction of the columns that hold numbers
+    cardinality: number of distinct values in each qualitative column
+    missing_rate: fraction of the numeric values written as MISSING_VALUE
+    formats: names of NUMBER_FORMATS used for the numeric columns, in turn
+    quoting: csv quoting constant passed to csv.writer
+    seed: seed of the random values, so the same arguments write the same file
+'''
+def generate_csv(file_path, rows:int, columns:int=6, numeric_ratio:float=0.5, cardinality:int=100, missing_rate:float=0.01, formats=("plain", "decimal", "thousands", "currency"), quoting:int=csv.QUOTE_MINIMAL, seed:int=0) -> list:
+    generator = random.Random(seed)
+    numeric_columns = round(columns * numeric_ratio)
+    headers = [f"Category {number}" for number in range(columns - numeric_columns)]
+    headers += [f"Amount {number}" for number in range(numeric_columns)]
+    column_formats = [NUMBER_FORMATS[formats[number % len(formats)]] for number in range(numeric_columns)]
+    #some qualitative values have commas so that quoted fields are parsed too
+    categories = [f"value {number}" if number % 10 else f"value, {number}" for number in range(cardinality)]
+    with open(file_path, "w", newline="") as f:
+        writer = csv.writer(f, quoting=quoting)
+        writer.writerow(headers)
+        for _ in range(rows):
+            row = [generator.choice(categories) for _ in range(columns - numeric_columns)]
+            for number_format in column_formats:
+                if generator.random() < missing_rate:
+                    row.append(MISSING_VALUE)
+                else:
+                    row.append(number_format(generator.uniform(0, 100000)))
+            writer.writerow(row)
+    return headers
+'''
+    Time repetitions calls of function with time.perf_counter, then measure its peak memory with tracemalloc in
+    one more call, so tracing doesn't slow the timed calls. setup is called before each call, untimed, and its
+    return value is passed to function.
+    Returns a dictionary of the timings in seconds, peak memory in bytes and rows per second of the fastest call.
+'''
+def measure(function, repetitions:int, rows:int, setup=None) -> dict:
+    times = []
+    for _ in range(repetitions):
+        args = (setup(),) if setup is not None else ()
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    args = (setup(),) if setup is not None else ()
+    tracemalloc.start()
+    try:
+        function(*args)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "times": times,
+        "min": min(times),
+        "mean": sum(times) / len(times),
+        "peak_memory": peak_memory,
+        "rows_per_second": rows / min(times) if min(times) else None,
+    }
+'''
+    Run every benchmark on a synthetic file in directory and return the results as a json compatible dictionary.
+    **generate_kwargs: passed to generate_csv
+'''
+def run(directory, rows:int, repetitions:int=5, **generate_kwargs) -> dict:
+    file_path = os.path.join(directory, "benchmark.csv")
+    headers = generate_csv(file_path, rows, **generate_kwargs)
+    data = DataFile(file_path)
+    category = next((header for header in headers if header.startswith("Category")), headers[0])
+    amounts = [header for header in headers if header.startswith("Amount")]
+    related = headers[1] if len(headers) > 1 else headers[0]
+
+    def copy_file():
+        copy_path = os.path.join(directory, "update.csv")
+        shutil.copyfile(file_path, copy_path)
+        return DataFile(copy_path)
+
+    #the query cache is cleared so that every repetition computes its result
+    def relationships():
+        data.relationships = {}
+        data.relationship_index = RelationshipIndex()
+        data.query_cache.clear()
+        data.get_relationships(category, related)
+
+    def filter_count():
+        data.query_cache.clear()
+        Filter(data, f"{amounts[0] if amounts else category}>=50000").count()
+
+    benchmarks = {
+        "construction": lambda: DataFile(file_path),
+        "get_relationships": relationships,
+        "update_value": (lambda copy: copy.update_value(MISSING_VALUE, -1, *amounts), copy_file),
+        "filter": filter_count,
+    }
+    results = {}
+    for name, benchmark in benchmarks.items():
+        function, setup = benchmark if isinstance(benchmark, tuple) else (benchmark, None)
+        results[name] = measure(function, repetitions, rows, setup)
+    return {
+        "environment": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+        },
+        "parameters": dict(generate_kwargs, rows=rows, repetitions=repetitions, file_bytes=os.path.getsize(file_path)),
+        "results": results,
+    }
+'''
+    Compare benchmark results with a saved baseline. Returns a list of regression messages for benchmarks whose fastest
+    time or peak memory grew by more than threshold (a fraction) over the baseline.
+'''
+def compare(results:dict, baseline:dict, threshold:float=0.1) -> list:
+    regressions = []
+    for name, result in results["results"].items():
+        if name not in baseline["results"]:
+            continue
+        base = baseline["results"][name]
+        for key in ("min", "peak_memory"):
+            if base[key] and result[key] > base[key] * (1 + threshold):
+                regressions.append(f"{name} {key}: {result[key]:.6g} vs baseline {base[key]:.6g} (+{result[key] / base[key] - 1:.1%})")
+    return regressions
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark csv_processor on a synthetic csv file.")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--columns", type=int, default=6)
+    parser.add_argument("--numeric-ratio", type=float, default=0.5)
+    parser.add_argument("--cardinality", type=int, default=100)
+    parser.add_argument("--missing-rate", type=float, default=0.01)
+    parser.add_argument("--formats", nargs="+", choices=list(NUMBER_FORMATS.keys()), default=list(NUMBER_FORMATS.keys()))
+    parser.add_argument("--quote-all", action="store_true", help="quote every field")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--output", help="write the json results to this file instead of printing them")
+    parser.add_argument("--compare", metavar="BASELINE", help="json results to compare against; regressions exit with status 1")
+    parser.add_argument("--threshold", type=float, default=0.1, help="fraction a result may grow over the baseline")
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory() as directory:
+        results = run(directory, args.rows, args.repetitions, columns=args.columns, numeric_ratio=args.numeric_ratio,
+            cardinality=args.cardinality, missing_rate=args.missing_rate, formats=tuple(args.formats),
+            quoting=csv.QUOTE_ALL if args.quote_all else csv.QUOTE_MINIMAL, seed=args.seed)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    if args.compare:
+        with open(args.compare, "r") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+import argparse
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .DataFile import DataFile
+'''
+    Return the files matched by paths and glob patterns, in order and without duplicates.
+    Patterns that match nothing are returned as they are, so they are reported as missing files.
+'''
+def expand_paths(patterns:list) -> list:
+    paths = []
+    for pattern in patterns:
+        matches = sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+        paths.extend(matches if matches else [pattern])
+    return list(dict.fromkeys(os.path.abspath(path) for path in paths))
+'''
+    Return the (size, modification time) of a file, which a checkpoint records so that changed files are profiled again
+'''
+def _file_state(path:str) -> tuple:
+    stat = os.stat(path)
+    return (stat.st_size, stat.st_mtime_ns)
+'''
+    Return a dictionary of path to (size, modification time) of the files recorded in a checkpoint file.
+    A line that was cut off when a run was interrupted is ignored.
+'''
+def read_checkpoint(checkpoint:str) -> dict:
+    finished = {}
+    if not os.path.isfile(checkpoint):
+        return finished
+    with open(checkpoint, "r") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                finished[entry["file"]] = (entry["size"], entry["mtime_ns"])
+            except (ValueError, KeyError, TypeError):
+                continue
+    return finished
+'''
+    Profile one file and return its json line as a dictionary, with the error message instead of the metadata if it
+    can't be profiled. Runs in a worker process.
+'''
+def profile_file(path:str, kwargs:dict) -> dict:
+    try:
+        state = _file_state(path)
+        data = DataFile(path, **kwargs)
+    #a missing or malformed file is reported without stopping the rest of the run
+    except Exception as error:
+        return {"file": path, "error": f"{type(error).__name__}: {error}"}
+    headers = []
+    for meta in data.headers.profiled():
+        values = meta.to_dict()
+        if meta.sampled:
+            values["intervals"] = meta.intervals
+        headers.append(values)
+    return {
+        "file": path,
+        "size": state[0],
+        "mtime_ns": state[1],
+        "rows": data._number_rows - 1,
+        "columns": data._number_columns,
+        "sampled": data.sampled,
+        "headers": headers,
+    }
+'''
+    Profile files and yield the json line dictionary of each file as soon as it is profiled.
+    With more than one job, files are profiled in a process pool and yielded in the order they finish.
+'''
+def profile_files(paths:list, kwargs:dict, jobs:int=1):
+    if jobs <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield profile_file(path, kwargs)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(profile_file, path, kwargs) for path in paths]
+        for future in as_completed(futures):
+            yield future.result()
+
+'''
+    Run the profile command: print one json line for each file and record the files that were profiled in the
+    checkpoint, so a run that is started again with the same checkpoint skips the files that haven't changed since.
+    Returns 1 if any file couldn't be profiled, otherwise 0.
+    output: text file the json lines are written to. Default is sys.stdout.
+'''
+def profile_command(args, output=None) -> int:
+    if output is None:
+        output = sys.stdout
+    paths = expand_paths(args.paths)
+    if args.checkpoint:
+        finished = read_checkpoint(args.checkpoint)
+        paths = [path for path in paths if not (path in finished and os.path.isfile(path) and finished[path] == _file_state(path))]
+    kwargs = {"max_distinct": args.max_distinct, "fast_path": args.fast_path}
+    if args.columns:
+        kwargs["columns"] = args.columns
+    if args.sample:
+        kwargs["sample_rows"] = args.sample
+        kwargs["sample_seed"] = args.seed
+    if args.delimiter:
+        kwargs["delimiter"] = args.delimiter
+    status = 0
+    checkpoint = open(args.checkpoint, "a") if args.checkpoint else None
+    try:
+        for result in profile_files(paths, kwargs, args.jobs):
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+            if "error" in result:
+                status = 1
+            elif checkpoint is not None:
+                checkpoint.write(json.dumps({"file": result["file"], "size": result["size"], "mtime_ns": result["mtime_ns"]}) + "\n")
+                checkpoint.flush()
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+    return status
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="csv-processor", description="Profile csv files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    profile = commands.add_parser("profile", help="print the metadata of each file as a json line as soon as it is profiled")
+    profile.add_argument("paths", nargs="+", help="csv files or glob patterns, such as 'data/**/*.csv'")
+    profile.add_argument("--jobs", type=int, default=1, help="number of files profiled at once in a process pool")
+    profile.add_argument("--columns", nargs="+", help="only profile these columns")
+    profile.add_argument("--sample", type=int, metavar="ROWS", help="estimate the metadata from random blocks with about this many rows. Every column is sampled, so it can't be combined with --columns")
+    profile.add_argument("--seed", type=int, help="seed of the sampled blocks")
+    profile.add_argument("--max-distinct", type=int, help="maximum number of distinct values counted exactly in each column")
+    profile.add_argument("--delimiter", help="csv delimiter. Default is ,")
+    profile.add_argument("--fast-path", action="store_true", help="split lines without csv.reader where possible")
+    profile.add_argument("--checkpoint", metavar="FILE", help="record profiled files here and skip the unchanged ones when the run is started again")
+    args = parser.parse_args(argv)
+    #DataFile can't sample a projection, which would otherwise fail every file of the run
+    if args.sample and args.columns:
+        profile.error("--sample can't be combined with --columns")
+    return profile_command(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
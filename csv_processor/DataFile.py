@@ -1,9 +1,34 @@
+import array
+import asyncio
+import base64
+import bz2
 import csv
+import gzip
+import hashlib
+import heapq
+import io
+import json
+import locale
+import lzma
+import math
+import mmap
+import operator
 import os
+import pickle
+import random
+import sys
 import shutil
 import tempfile
+import time
+from collections import Counter, OrderedDict
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import chain, compress, islice, repeat
 from pathlib import Path
-#from collections import OrderedDict
+try:
+    import numpy
+except ImportError:
+    numpy = None
 '''
     Remove chars , and $ from a string
 '''
@@ -27,7 +52,841 @@ def _convert_string_to_number(value):
         return float(number_string)
     else:
         raise TypeError(f"{value} cannot be converted to int or float.")
-    
+
+#character used to join a column of values so it can be stripped in a single call
+_BATCH_SEPARATOR = "\x00"
+#number of rows classified together when profiling
+PROFILE_BATCH_ROWS = 4096
+'''
+    Remove chars , and $ from every string in a list of values
+'''
+def _convert_to_decimal_strings(values:list) -> list:
+    joined = _BATCH_SEPARATOR.join(values)
+    if joined.count(_BATCH_SEPARATOR) != len(values) - 1:
+        return [_convert_to_decimal_string(value) for value in values]
+    return _convert_to_decimal_string(joined).split(_BATCH_SEPARATOR)
+'''
+    Return a list that is true for each value in a list of values that can be converted to a number.
+    stripped: values with , and $ already removed, if they are available.
+'''
+def _decimal_mask(values:list, stripped:list=None) -> list:
+    if stripped is None:
+        stripped = _convert_to_decimal_strings(values)
+    return [number.isdecimal() or number.replace("-", "0", 1).replace(".", "0", 1).isdecimal() for number in stripped]
+'''
+    Convert the stripped values that the mask marks as numbers to int or float, with 0 for the other values.
+    Values such as "-" or "2020-01" that pass _is_decimal but can't be converted are set to false in mask.
+'''
+def _convert_values(stripped:list, mask:list) -> list:
+    try:
+        return [(int(number) if number.count(".") == 0 else float(number)) if is_number else 0 for number, is_number in zip(stripped, mask)]
+    except ValueError:
+        numbers = []
+        for index, (number, is_number) in enumerate(zip(stripped, mask)):
+            if is_number:
+                try:
+                    numbers.append(int(number) if number.count(".") == 0 else float(number))
+                    continue
+                except ValueError:
+                    mask[index] = False
+            numbers.append(0)
+        return numbers
+'''
+    Classify and convert a column (or any list) of values in one call.
+    Returns a mask that is true for each value that can be converted to a number, and a typed array of the
+    converted numbers with 0 where the mask is false. The array holds ints when every number is an int and
+    floats otherwise. Uses numpy arrays when numpy is installed, otherwise a list and an array.array.
+'''
+def classify_values(values:list) -> tuple:
+    stripped = _convert_to_decimal_strings(values)
+    mask = _decimal_mask(values, stripped)
+    numbers = _convert_values(stripped, mask)
+    is_float = any(type(number) is float for number in numbers)
+    if numpy is not None:
+        if is_float:
+            return numpy.array(mask, dtype=bool), numpy.array(numbers, dtype=numpy.float64)
+        try:
+            return numpy.array(mask, dtype=bool), numpy.array(numbers, dtype=numpy.int64)
+        except OverflowError:
+            return numpy.array(mask, dtype=bool), numpy.array(numbers, dtype=object)
+    if is_float:
+        return mask, array.array("d", numbers)
+    try:
+        return mask, array.array("q", numbers)
+    except OverflowError:
+        return mask, numbers
+'''
+    Return the datatype of a column that has seen values of both datatypes
+'''
+def _combine_datatypes(first, second):
+    if first is None:
+        return second
+    if second is None or first == second:
+        return first
+    return "both"
+'''
+    Yield lists of up to size rows from an iterable of rows
+'''
+def _batches(rows, size:int=PROFILE_BATCH_ROWS):
+    rows = iter(rows)
+    batch = list(islice(rows, size))
+    while batch:
+        yield batch
+        batch = list(islice(rows, size))
+'''
+    Return the values of each column in a batch of rows, in column number order.
+'''
+def _batch_columns(batch:list, number_columns:int) -> list:
+    columns = list(zip(*batch))
+    if len(columns) < number_columns:
+        #a row is shorter than the header, so index every row to raise the same IndexError as a row by row scan
+        return [[row[number] for row in batch] for number in range(number_columns)]
+    return columns
+'''
+Class to collect per stage timings, row and byte counts and progress events of a DataFile and the operations run on it.
+A disabled Stats object collects nothing, and the profiling loops skip their timers entirely.
+
+enabled: collect timings and counts. Default is True.
+observers: callables that are called with (event, details dictionary) for "start", "progress" and "end" events.
+timers: dictionary; key is stage, value is cumulative seconds. Profiling stages are "tokenize" (reading and parsing
+csv text), "classify" (finding numbers), "count" (updating Metadata counts) and "store" (column store and zone map).
+Operations such as "construct", "refresh", "relationships", "update" and "filter" are timed as a whole.
+rows: dictionary; key is operation, value is number of rows processed
+bytes: dictionary; key is operation, value is number of bytes of the file processed
+'''
+class Stats:
+    def __init__(self, enabled:bool=True, observers:list=None):
+        self.enabled = enabled
+        self.observers = list(observers or [])
+        self.timers = {}
+        self.rows = {}
+        self.bytes = {}
+
+    '''
+    Add seconds to the cumulative time of a stage
+    '''
+    def add_time(self, stage:str, seconds:float):
+        self.timers[stage] = self.timers.get(stage, 0.0) + seconds
+
+    '''
+    Count rows and bytes processed by an operation, and send a progress event to the observers
+    '''
+    def add_rows(self, operation:str, rows:int, size:int=0):
+        self.rows[operation] = self.rows.get(operation, 0) + rows
+        if size:
+            self.bytes[operation] = self.bytes.get(operation, 0) + size
+        self.notify("progress", operation=operation, rows=self.rows[operation])
+
+    '''
+    Call every observer with an event
+    '''
+    def notify(self, event:str, **details):
+        for observer in self.observers:
+            observer(event, details)
+
+    '''
+    Return a context manager that times an operation and sends "start" and "end" events to the observers.
+    Does nothing when disabled.
+    '''
+    def timer(self, operation:str):
+        if not self.enabled:
+            return nullcontext()
+        return _StageTimer(self, operation)
+
+    '''
+    Return self if enabled, otherwise None, for passing to the profiling loops
+    '''
+    def active(self):
+        return self if self.enabled else None
+
+    '''
+    Clear the timings and counts
+    '''
+    def reset(self):
+        self.timers = {}
+        self.rows = {}
+        self.bytes = {}
+
+    def to_dict(self) -> dict:
+        return {"timers": dict(self.timers), "rows": dict(self.rows), "bytes": dict(self.bytes)}
+
+    def __repr__(self):
+        if not self.enabled:
+            return "<Stats disabled>"
+        rep = "<Stats>"
+        for stage in list(self.timers.keys()) + [operation for operation in self.rows.keys() if operation not in self.timers]:
+            rep = rep + f"\n{stage}:"
+            if stage in self.timers:
+                rep = rep + f" {self.timers[stage]:.6f}s"
+            if stage in self.rows:
+                rep = rep + f" {self.rows[stage]} rows"
+            if stage in self.bytes:
+                rep = rep + f" {self.bytes[stage]} bytes"
+        return rep
+
+'''
+Context manager for Stats.timer
+'''
+class _StageTimer:
+    def __init__(self, stats:Stats, operation:str):
+        self.stats = stats
+        self.operation = operation
+
+    def __enter__(self):
+        self.stats.notify("start", operation=self.operation)
+        self.start = time.perf_counter()
+        return self.stats
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        self.stats.add_time(self.operation, seconds)
+        self.stats.notify("end", operation=self.operation, seconds=seconds)
+        return False
+'''
+    Yield the items of an iterable, adding the time spent getting each one to a stage of stats
+'''
+def _timed(iterable, stats:Stats, stage:str):
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            stats.add_time(stage, time.perf_counter() - start)
+            return
+        stats.add_time(stage, time.perf_counter() - start)
+        yield item
+'''
+    Update a Metadata object with a list of values from its column
+    mask: result of _decimal_mask for the values, if it is available.
+'''
+def _profile_values(values:list, meta, mask:list=None):
+    if mask is None:
+        mask = _decimal_mask(values)
+    quantitative = sum(mask)
+    if quantitative:
+        meta.add_quantitative(quantitative)
+    if quantitative < len(values):
+        for value, count in Counter(compress(values, [not is_number for is_number in mask])).items():
+            meta.add_qualitative(value, count)
+'''
+    Update Metadata objects with the values of each row. metas is a list of Metadata objects for the columns to profile.
+    Rows are classified a column at a time in batches of PROFILE_BATCH_ROWS. Returns the last row, or None if there were no rows.
+    column_writer: optional _ColumnStoreWriter that also stores the values of the profiled columns.
+    zone_map: optional ZoneMap that also records statistics of each block of rows. Batches are one block long.
+    stats: optional enabled Stats object that times the stages of profiling.
+'''
+def _profile_rows(rows, metas:list, column_writer=None, zone_map=None, stats=None):
+    number_columns = max([meta.number for meta in metas], default=-1) + 1
+    last_row = None
+    batches = _batches(rows, zone_map.block_rows if zone_map is not None else PROFILE_BATCH_ROWS)
+    if stats is not None:
+        batches = _timed(batches, stats, "tokenize")
+    for batch in batches:
+        _profile_batch(_batch_columns(batch, number_columns), len(batch), metas, column_writer, zone_map, stats)
+        last_row = batch[-1]
+    return last_row
+'''
+    Update Metadata objects with a batch of rows given as a list of the values of each column.
+    size: number of rows in the batch
+    See _profile_rows for the other parameters.
+'''
+def _profile_batch(columns:list, size:int, metas:list, column_writer=None, zone_map=None, stats=None):
+    for meta in metas:
+        values = columns[meta.number]
+        if stats is not None:
+            start = time.perf_counter()
+        stripped = _convert_to_decimal_strings(values)
+        mask = _decimal_mask(values, stripped)
+        if stats is not None:
+            classified = time.perf_counter()
+            stats.add_time("classify", classified - start)
+        _profile_values(values, meta, mask)
+        if stats is not None:
+            counted = time.perf_counter()
+            stats.add_time("count", counted - classified)
+        if column_writer is not None:
+            column_writer.add_values(meta.number, values, stripped, mask)
+        if zone_map is not None:
+            zone_map.add_values(meta.name, stripped, mask)
+        if stats is not None:
+            stats.add_time("store", time.perf_counter() - counted)
+    if zone_map is not None:
+        zone_map.end_block(size)
+    if stats is not None:
+        stats.add_rows("profile", size)
+
+#size of the blocks of a memory mapped file that the fast path decodes and splits at once
+FAST_PATH_BLOCK_BYTES = 1024 * 1024
+#blocks where more than this fraction of the lines have a quote character are parsed with csv.reader instead
+FAST_PATH_QUOTED_LINES = 0.125
+'''
+Raised when the fast path finds a record that spans lines, so the file has to be read with csv.reader
+'''
+class _FastPathError(Exception):
+    pass
+'''
+    Return the (delimiter, quotechar) of csv.reader kwargs whose rows the fast path can split, or None if the dialect
+    has escape characters, undoubled quotes, skipinitialspace, strict parsing or a quoting mode that changes values.
+'''
+def _fast_path_dialect(**kwargs):
+    dialect = csv.reader([], **kwargs).dialect
+    if dialect.quoting not in (csv.QUOTE_MINIMAL, csv.QUOTE_ALL) or dialect.escapechar is not None or not dialect.doublequote or dialect.skipinitialspace or dialect.strict:
+        return None
+    return dialect.delimiter, dialect.quotechar
+'''
+    Yield the row of each line in a list of lines that each hold one record, parsed with csv.reader. A quoted field that
+    doesn't end on its line would take the next line, so a blank line is parsed after them to catch the last one.
+    Raises _FastPathError after the rows if any record spans lines, or if csv.reader can't parse a line, so the file is
+    read again like a normal scan, which raises the same csv.Error if the file is malformed.
+'''
+def _parse_lines(lines:list, kwargs:dict):
+    reader = csv.reader(chain(lines, [""]), **kwargs)
+    try:
+        yield from islice(reader, len(lines))
+        last = next(reader, None)
+    except csv.Error as error:
+        raise _FastPathError() from error
+    if last != [] or reader.line_num != len(lines) + 1:
+        raise _FastPathError()
+'''
+    Yield (columns, size, lines, last row) for each batch of PROFILE_BATCH_ROWS rows of a memory mapped csv file,
+    starting at byte offset start. columns has the values of each column number in wanted and None for the other
+    columns, and lines is the number of lines the batch takes in the file.
+
+    The file is decoded a block at a time and every line is one row. Lines without a quote character are split on the
+    delimiter all at once, and lines with one are parsed by csv.reader and put in their place. From the first block
+    with many quoted lines, or with lines without a value for each header, the rest of the file is streamed through
+    csv.reader like a normal scan, which is faster than parsing the lines of each block.
+    Raises _FastPathError if a quoted field holds a newline before that block.
+'''
+def _fast_batches(file, mapped, start:int, number_columns:int, wanted:set, kwargs:dict, dialect:tuple, encoding:str, block_size:int=FAST_PATH_BLOCK_BYTES):
+    delimiter, quotechar = dialect
+    width = max(wanted) + 1
+    size = len(mapped)
+    position = start
+    leftover = []
+    while position < size:
+        block_start = position
+        end = mapped.find(b"\n", position + block_size) + 1 or size
+        text = mapped[position:end].decode(encoding)
+        position = end
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        lines = text.split("\n")
+        if not lines[-1]:
+            lines.pop()
+        #a quoted field has two quote characters, so this bounds the number of quoted lines without finding them
+        quotes = text.count(quotechar)
+        if quotes > 2 * len(lines) * FAST_PATH_QUOTED_LINES or "\x00" in text:
+            break
+        previous = leftover
+        if leftover:
+            lines = leftover + lines
+        #rows are batched as in a normal scan, so approximate counts come out the same
+        if position < size:
+            cut = len(lines) - len(lines) % PROFILE_BATCH_ROWS
+            lines, leftover = lines[:cut], lines[cut:]
+        if not lines:
+            continue
+        quoted = [number for number, line in enumerate(lines) if quotechar in line] if quotes else []
+        parsed = list(_parse_lines([lines[number] for number in quoted], kwargs))
+        for number in quoted:
+            lines[number] = delimiter * (number_columns - 1)
+        counts = set(map(str.count, lines, repeat(delimiter)))
+        if counts != {number_columns - 1} or any(len(row) != number_columns for row in parsed) or (number_columns == 1 and "" in lines):
+            leftover = previous
+            break
+        values = delimiter.join(lines).split(delimiter)
+        for number, row in zip(quoted, parsed):
+            values[number * number_columns:(number + 1) * number_columns] = row
+        for first in range(0, len(lines), PROFILE_BATCH_ROWS):
+            last = min(first + PROFILE_BATCH_ROWS, len(lines))
+            columns = [values[first * number_columns + column:last * number_columns:number_columns] if column in wanted else None for column in range(width)]
+            yield columns, last - first, last - first, values[(last - 1) * number_columns:last * number_columns]
+    else:
+        return
+    with open(file, "rb") as f:
+        f.seek(block_start)
+        reader = csv.reader(io.TextIOWrapper(f, encoding=encoding), **kwargs)
+        counted = 0
+        for batch in _batches(chain(_parse_lines(leftover, kwargs), reader)):
+            lines = len(leftover) + reader.line_num
+            yield _batch_columns(batch, width), len(batch), lines - counted, batch[-1]
+            counted = lines
+
+'''
+Class to iterate the lines of a text file opened with newline="" while counting the bytes they take in the file.
+Line endings are translated to "\n", so csv.reader sees the same lines as from a file opened in text mode.
+
+start: byte offset of the first line in the file
+'''
+class _CountingLines:
+    def __init__(self, f, start:int=0):
+        self._lines = iter(f)
+        self._encoding = f.encoding
+        self.bytes = start
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = next(self._lines)
+        self.bytes += len(line) if line.isascii() else len(line.encode(self._encoding))
+        if line.endswith("\r\n"):
+            return line[:-2] + "\n"
+        if line.endswith("\r"):
+            return line[:-1] + "\n"
+        return line
+
+'''
+Class to keep statistics for each block of block_rows rows of a file, recorded while it is profiled.
+Filters use them to skip blocks that can't match a numeric test and read only the byte ranges of the others.
+
+blocks: list of (start byte offset, end byte offset, first row number, number of rows) for each block
+columns: dictionary; key is column name, value is a list of (min, max, null count) for each block. null count is
+the number of values that aren't numbers, and min and max are None if the block has no numbers in the column.
+'''
+class ZoneMap:
+    def __init__(self, block_rows:int):
+        self.block_rows = block_rows
+        self.blocks = []
+        self.columns = {}
+        self._lines = None
+        self._offset = 0
+        self._stats = {}
+
+    '''
+    Start recording blocks from a _CountingLines iterator that a csv.reader is reading from
+    '''
+    def start(self, lines:_CountingLines):
+        self._lines = lines
+        self._offset = lines.bytes
+
+    '''
+    Record the statistics of a column in the current block
+    '''
+    def add_values(self, column:str, stripped:list, mask:list):
+        if any(mask):
+            numbers = [number for number in _store_numbers(stripped, mask) if number == number]
+        else:
+            numbers = []
+        if numbers:
+            self._stats[column] = (min(numbers), max(numbers), len(stripped) - len(numbers))
+        else:
+            self._stats[column] = (None, None, len(stripped))
+
+    '''
+    Finish the current block, which ends where the csv.reader has read to
+    '''
+    def end_block(self, rows:int):
+        first_row = self.blocks[-1][2] + self.blocks[-1][3] if self.blocks else 0
+        for column, stats in self._stats.items():
+            self.columns.setdefault(column, []).append(stats)
+        self.blocks.append((self._offset, self._lines.bytes, first_row, rows))
+        self._offset = self._lines.bytes
+        self._stats = {}
+
+    '''
+    Record the blocks of rows read by a csv.reader from lines, without profiling them.
+    Columns that were profiled after the first blocks have no statistics for those blocks, so they are left out.
+    '''
+    def add_rows(self, rows, lines:_CountingLines, metas:list):
+        if self.blocks:
+            metas = [meta for meta in metas if meta.name in self.columns]
+        self.start(lines)
+        number_columns = max([meta.number for meta in metas], default=-1) + 1
+        for batch in _batches(rows, self.block_rows):
+            columns = _batch_columns(batch, number_columns)
+            for meta in metas:
+                stripped = _convert_to_decimal_strings(columns[meta.number])
+                self.add_values(meta.name, stripped, _decimal_mask(columns[meta.number], stripped))
+            self.end_block(len(batch))
+
+    '''
+    Return the end offset of the last block, or None if there are no blocks
+    '''
+    def end(self):
+        return self.blocks[-1][1] if self.blocks else None
+
+    def to_dict(self) -> dict:
+        return {"block_rows": self.block_rows, "blocks": self.blocks, "columns": self.columns}
+
+    @staticmethod
+    def from_dict(values:dict):
+        zone_map = ZoneMap(values["block_rows"])
+        zone_map.blocks = [tuple(block) for block in values["blocks"]]
+        zone_map.columns = {column: [tuple(stats) for stats in blocks] for column, blocks in values["columns"].items()}
+        return zone_map
+
+#target size of the byte ranges profiled by each worker process
+PARALLEL_CHUNK_BYTES = 64 * 1024 * 1024
+#files smaller than this are always profiled serially
+PARALLEL_MIN_BYTES = 1024 * 1024
+'''
+    Return the quote character to track when splitting a file with the given csv.reader kwargs, or None if quoted
+    fields can't contain record boundaries. Raises ValueError if the dialect can't be split on byte boundaries.
+'''
+def _split_quotechar(**kwargs):
+    dialect = csv.reader([], **kwargs).dialect
+    if dialect.quoting == csv.QUOTE_NONE:
+        return None
+    if dialect.escapechar is not None or not dialect.doublequote:
+        raise ValueError("Dialects with an escapechar can't be split into byte ranges.")
+    return dialect.quotechar.encode()
+'''
+    Return the byte offset of the first record boundary at or after target, scanning from start.
+    A newline is a record boundary when an even number of quote characters precede it, since doubled
+    quotes inside a quoted field always come in pairs. Returns the file size if there is no later boundary.
+'''
+def _next_record_boundary(file, start:int, target:int, quotechar:bytes, block_size:int=1024 * 1024):
+    quotes = 0
+    position = start
+    with open(file, "rb") as f:
+        f.seek(start)
+        block = f.read(block_size)
+        while block:
+            search_from = max(target - position - 1, 0)
+            checked = 0
+            while True:
+                newline = block.find(b"\n", search_from)
+                if newline == -1:
+                    break
+                if quotechar is not None:
+                    quotes += block.count(quotechar, checked, newline)
+                checked = newline
+                if quotes % 2 == 0 and position + newline + 1 >= target:
+                    return position + newline + 1
+                search_from = newline + 1
+            if quotechar is not None:
+                quotes += block.count(quotechar, checked)
+            position += len(block)
+            block = f.read(block_size)
+    return position
+'''
+    Split file into byte ranges between start and the end of the file, each starting on a record boundary.
+'''
+def _record_ranges(file, start:int, chunks:int, quotechar:bytes):
+    size = os.path.getsize(file)
+    step = max((size - start) // chunks, 1)
+    offsets = [start]
+    while offsets[-1] < size:
+        offsets.append(_next_record_boundary(file, offsets[-1], offsets[-1] + step, quotechar))
+    return list(zip(offsets[:-1], offsets[1:]))
+'''
+    Return the length of the complete records at the start of data, which must start on a record boundary.
+    Data after the last record that ends with a newline outside of a quoted field belongs to a record that is still
+    being written. Quote characters can appear literally inside unquoted fields, so data with quotes is parsed with
+    csv.reader to find that record, with a blank sentinel line that the reader only reads as a row of its own if the
+    data ends outside of a quoted field.
+'''
+def _complete_records_end(data:bytes, quotechar:bytes, kwargs:dict) -> int:
+    end = data.rfind(b"\n") + 1
+    if quotechar is None or data.find(quotechar, 0, end) == -1:
+        return end
+    lines = _CountingLines(io.TextIOWrapper(io.BytesIO(data[:end]), newline=""))
+    complete = previous = 0
+    for row in csv.reader(chain(lines, ["\n"]), **kwargs):
+        complete, previous = previous, lines.bytes
+    return complete
+'''
+    Read the rows between two byte offsets of a file as text with csv.reader.
+'''
+def _range_reader(file, start:int, end:int, **kwargs):
+    with open(file, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return csv.reader(io.TextIOWrapper(io.BytesIO(data)), **kwargs)
+'''
+    Iterate the rows of a csv.reader over lines that end with a blank sentinel line, without the row the sentinel
+    ends. closed is set once the rows are read, to whether the sentinel was read as a row of its own, which it only is
+    if the lines before it ended outside of a quoted field.
+'''
+class _SentinelRows:
+    def __init__(self, reader):
+        self.reader = reader
+        self.closed = False
+
+    def __iter__(self):
+        previous = next(self.reader, None)
+        for row in self.reader:
+            yield previous
+            previous = row
+        self.closed = previous == []
+'''
+    Profile the rows in a byte range of a file. Runs in a worker process.
+    Returns the list of Metadata objects for the range, the number of lines read, the last row and whether the range
+    ended outside of a quoted field, which the next range must for it to start on a record boundary.
+'''
+def _profile_range(file, start:int, end:int, columns:list, kwargs:dict, max_distinct:int=None):
+    with open(file, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+        last = not f.read(1)
+    metas = [Metadata(name, number, max_distinct) for name, number in columns]
+    lines = io.TextIOWrapper(io.BytesIO(data))
+    if last:
+        reader = csv.reader(lines, **kwargs)
+        last_row = _profile_rows(reader, metas)
+        return metas, reader.line_num, last_row, True
+    reader = csv.reader(chain(lines, ["\n"]), **kwargs)
+    rows = _SentinelRows(reader)
+    last_row = _profile_rows(rows, metas)
+    return metas, reader.line_num - 1, last_row, rows.closed
+
+#size of the blocks that sampling splits a file into. Each block holds the records that start in it.
+SAMPLE_BLOCK_BYTES = 64 * 1024
+#z score of the confidence intervals of sampled counts (95%)
+SAMPLE_CONFIDENCE_Z = 1.96
+'''
+    Return the offset of the first line start at or after offset, which is 0 or the offset after a newline.
+    Returns the file size if there is no later line.
+'''
+def _line_start(f, offset:int, block_size:int=64 * 1024) -> int:
+    if offset <= 0:
+        return 0
+    position = offset - 1
+    f.seek(position)
+    block = f.read(block_size)
+    while block:
+        newline = block.find(b"\n")
+        if newline != -1:
+            return position + newline + 1
+        position += len(block)
+        block = f.read(block_size)
+    return position
+'''
+    Return a dictionary of each offset to the number of quote characters before it in the file
+'''
+def _quote_counts(file, offsets:list, quotechar:bytes, block_size:int=1024 * 1024) -> dict:
+    counts = {}
+    quotes = 0
+    position = 0
+    with open(file, "rb") as f:
+        for offset in sorted(set(offsets)):
+            while position < offset:
+                block = f.read(min(block_size, offset - position))
+                if not block:
+                    break
+                quotes += block.count(quotechar)
+                position += len(block)
+            counts[offset] = quotes
+    return counts
+'''
+    Yield the rows of reader until lines, the _CountingLines it reads, reaches the byte offset end
+'''
+def _rows_before_offset(reader, lines:_CountingLines, end:int):
+    for row in reader:
+        yield row
+        if lines.bytes >= end:
+            return
+'''
+    Profile the rows in a byte range of a file that starts and ends on record boundaries. The range is streamed
+    through csv.reader, so memory doesn't grow with the range. Returns the number of lines read and the last row.
+'''
+def _profile_byte_range(file, start:int, end:int, metas:list, kwargs:dict, stats=None):
+    with open(file, "rb") as f:
+        f.seek(start)
+        lines = _CountingLines(io.TextIOWrapper(f, newline=""), start)
+        reader = csv.reader(lines, **kwargs)
+        last_row = _profile_rows(_rows_before_offset(reader, lines, end), metas, stats=stats)
+        return reader.line_num, last_row
+'''
+    Return the confidence interval of the number of rows of a file with a value, from the count of the value in a
+    sample of rows. The Wilson score interval assumes the rows were sampled independently, so values that cluster
+    in blocks of the file are less certain than their interval shows, and the error of the estimated total isn't included.
+    count: rows with the value in the sample
+    rows: rows in the sample
+    total: estimated rows in the file
+'''
+def _confidence_interval(count:int, rows:int, total:float, z:float=SAMPLE_CONFIDENCE_Z) -> tuple:
+    if rows == 0:
+        return (0, math.ceil(total))
+    proportion = count / rows
+    denominator = 1 + z * z / rows
+    center = (proportion + z * z / (2 * rows)) / denominator
+    half_width = z * math.sqrt(proportion * (1 - proportion) / rows + z * z / (4 * rows * rows)) / denominator
+    low = max(math.floor(max(center - half_width, 0) * total), count)
+    high = max(math.ceil(min(center + half_width, 1) * total), low)
+    return (low, high)
+
+'''
+Class to hold the blocks of a file read by sampling, so that they aren't read again when it is profiled exactly.
+
+blocks: dictionary; key is the start offset of a block, value is (end offset, list of Metadata of the block's rows,
+number of lines, last row)
+'''
+class _Sample:
+    def __init__(self, header_end:int, header_lines:int, first_row:list, size:int, inode:int):
+        self.header_end = header_end
+        self.header_lines = header_lines
+        self.first_row = first_row
+        self.size = size
+        self.inode = inode
+        self.blocks = {}
+        self.rows = 0
+
+    '''
+    Return the fraction of the file's data bytes that were sampled
+    '''
+    def fraction(self) -> float:
+        data_bytes = self.size - self.header_end
+        if data_bytes <= 0:
+            return 1.0
+        return sum(end - start for start, (end, metas, lines, last_row) in self.blocks.items()) / data_bytes
+
+    '''
+    Return the Metadata of every sampled row, merged in file order
+    '''
+    def merged(self, columns:list, max_distinct:int=None, value_dictionary=None) -> list:
+        metas = [Metadata(name, number, max_distinct, value_dictionary) for name, number in columns]
+        for start in sorted(self.blocks):
+            for meta, block_meta in zip(metas, self.blocks[start][1]):
+                meta.merge(block_meta)
+        return metas
+
+#number of bytes before the end of the last scan that refresh parses to check that the scanned data is unchanged
+REFRESH_CHECK_BYTES = 64 * 1024
+
+'''
+Class to intern the qualitative values of a DataFile. Each distinct value is stored once and numbered with an integer
+code, so the Metadata, RelationshipIndex and Relation objects of a file share one string per value instead of a copy each.
+'''
+class ValueDictionary:
+    __slots__ = ("codes", "values")
+
+    def __init__(self):
+        self.codes = {} #dictionary; key is value, value is code
+        self.values = [] #values by code
+
+    '''
+    Return the code of a value, adding it if it is new
+    '''
+    def encode(self, value:str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    '''
+    Return the stored string equal to a value, adding it if it is new
+    '''
+    def intern(self, value:str) -> str:
+        code = self.codes.get(value)
+        if code is None:
+            self.codes[value] = len(self.values)
+            self.values.append(value)
+            return value
+        return self.values[code]
+
+    def __getitem__(self, code:int) -> str:
+        return self.values[code]
+
+    def __len__(self):
+        return len(self.values)
+
+'''
+Class to keep approximate counts of the most frequent values in a column in bounded memory (Space-Saving).
+
+capacity: maximum number of values to keep. When a new value arrives and the summary is full, the value with the
+lowest count is replaced and the new value inherits its count. Every count is an overestimate by at most the
+value's entry in errors, and any value with a true count above the lowest kept count is always kept.
+'''
+class SpaceSaving:
+    __slots__ = ("capacity", "counts", "errors", "_heap")
+
+    def __init__(self, capacity:int):
+        self.capacity = capacity
+        self.counts = {} #dictionary; key is value, value is estimated count
+        self.errors = {} #dictionary; key is value, value is the most the count can be overestimated by
+        self._heap = [] #(count, value) entries, some of which are out of date
+
+    '''
+    Count occurrences of a value
+    '''
+    def add(self, value:str, count:int=1, error:int=0):
+        if value in self.counts:
+            self.counts[value] += count
+            self.errors[value] += error
+        elif len(self.counts) < self.capacity:
+            self.counts[value] = count
+            self.errors[value] = error
+        else:
+            minimum, evicted = self._pop_minimum()
+            del self.counts[evicted]
+            del self.errors[evicted]
+            self.counts[value] = minimum + count
+            self.errors[value] = minimum + error
+        heapq.heappush(self._heap, (self.counts[value], value))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(count, value) for value, count in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    '''
+    Remove and return the (count, value) entry with the lowest count, skipping heap entries that are out of date
+    '''
+    def _pop_minimum(self) -> tuple:
+        while True:
+            count, value = heapq.heappop(self._heap)
+            if self.counts.get(value) == count:
+                return count, value
+
+    '''
+    Return the lowest count kept, which bounds the count of every value that isn't kept
+    '''
+    def minimum(self) -> int:
+        return min(self.counts.values(), default=0) if len(self.counts) >= self.capacity else 0
+
+    '''
+    Add the counts of another summary
+    '''
+    def merge(self, other):
+        for value, count in other.counts.items():
+            self.add(value, count, other.errors[value])
+
+    def __eq__(self, other):
+        return self.counts == other.counts and self.errors == other.errors
+
+'''
+Class to estimate the number of distinct values in a column in fixed memory (HyperLogLog).
+
+precision: number of bits of each hash used to pick a register. The standard error is about 1.04 / sqrt(2 ** precision).
+'''
+class HyperLogLog:
+    __slots__ = ("precision", "registers")
+
+    def __init__(self, precision:int=12):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    '''
+    Add a value. Uses a keyed hash instead of hash() so that estimates from different processes can be merged.
+    '''
+    def add(self, value:str):
+        hashed = int.from_bytes(hashlib.blake2b(value.encode("utf-8", "surrogatepass"), digest_size=8).digest(), "big")
+        index = hashed >> (64 - self.precision)
+        remaining = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    '''
+    Return the estimated number of distinct values added
+    '''
+    def estimate(self) -> int:
+        m = len(self.registers)
+        estimate = (0.7213 / (1 + 1.079 / m)) * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    '''
+    Combine with another estimate, as if every value added to it had been added here
+    '''
+    def merge(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
 
 '''
 Class to track column metadata information
@@ -35,83 +894,1171 @@ The metadata tracked is:
 
 column_name: the column header
 column_number: the column number
+max_distinct: maximum number of distinct qualitative values to count exactly. When a column has more, its
+qualitative_values only keep the max_distinct most frequent values with approximate counts (see SpaceSaving)
+and the number of distinct values is estimated (see HyperLogLog). Default is None (no limit).
+value_dictionary: ValueDictionary that interns the qualitative values. The Metadata of a DataFile share the file's
+ValueDictionary. Default is None (a new ValueDictionary).
 '''
 class Metadata:
-    def __init__(self, column_name:str, column_number:int):
+    __slots__ = ("name", "number", "qualitative_values", "quantitative_values_count", "datatype", "max_distinct", "approximate",
+                 "_frequent_values", "_distinct_values", "sampled", "intervals", "quantitative_interval", "value_dictionary")
+
+    def __init__(self, column_name:str, column_number:int, max_distinct:int=None, value_dictionary:ValueDictionary=None):
         self.name = column_name
         self.number = column_number
         self.qualitative_values = {} #dictionary; key is qualitative value, value is count
         self.quantitative_values_count = 0
         self.datatype = None #qualitative(numbers), quantitative(string), or both
+        self.max_distinct = max_distinct
+        self.approximate = False #true once qualitative_values holds approximate counts of the most frequent values
+        self._frequent_values = None #SpaceSaving summary that owns qualitative_values once approximate
+        self._distinct_values = None #HyperLogLog estimate of the number of distinct values once approximate
+        self.sampled = False #true when the counts are estimated from a sample of the file's rows
+        self.intervals = {} #dictionary of sampled counts; key is qualitative value, value is (low, high) confidence interval
+        self.quantitative_interval = None #(low, high) confidence interval of a sampled quantitative_values_count
+        self.value_dictionary = value_dictionary if value_dictionary is not None else ValueDictionary()
+
+    '''
+    Return the metadata as a dictionary of json compatible values
+    '''
+    def to_dict(self) -> dict:
+        values = {
+            "name": self.name,
+            "number": self.number,
+            "qualitative_values": self.qualitative_values,
+            "quantitative_values_count": self.quantitative_values_count,
+            "datatype": self.datatype,
+            "max_distinct": self.max_distinct,
+            "approximate": self.approximate,
+        }
+        if self.approximate:
+            values["errors"] = self._frequent_values.errors
+            values["registers"] = base64.b64encode(self._distinct_values.registers).decode()
+        return values
+
+    '''
+    Create a Metadata object from a dictionary returned by to_dict
+    '''
+    @staticmethod
+    def from_dict(values:dict, value_dictionary:ValueDictionary=None):
+        meta = Metadata(values["name"], values["number"], values.get("max_distinct"), value_dictionary)
+        intern = meta.value_dictionary.intern
+        meta.qualitative_values = {intern(value): count for value, count in values["qualitative_values"].items()}
+        meta.quantitative_values_count = values["quantitative_values_count"]
+        meta.datatype = values["datatype"]
+        if values.get("approximate"):
+            meta.approximate = True
+            meta._frequent_values = SpaceSaving(meta.max_distinct)
+            for value, count in meta.qualitative_values.items():
+                meta._frequent_values.add(value, count, values["errors"][value])
+            meta.qualitative_values = meta._frequent_values.counts
+            meta._distinct_values = HyperLogLog()
+            meta._distinct_values.registers = bytearray(base64.b64decode(values["registers"]))
+        return meta
+
+    '''
+    Switch from exact counts to a summary of the most frequent values and an estimate of the distinct values
+    '''
+    def _make_approximate(self):
+        self._distinct_values = HyperLogLog()
+        self._frequent_values = SpaceSaving(self.max_distinct)
+        for value in self.qualitative_values.keys():
+            self._distinct_values.add(value)
+        most_frequent = heapq.nlargest(self.max_distinct, self.qualitative_values.items(), key=lambda item: item[1])
+        most_frequent = set(value for value, count in most_frequent)
+        for value, count in self.qualitative_values.items():
+            if value in most_frequent:
+                self._frequent_values.add(value, count)
+        self.qualitative_values = self._frequent_values.counts
+        self.approximate = True
+
+    '''
+    Return the number of distinct qualitative values, which is an estimate if the column is approximate
+    '''
+    def distinct_count(self) -> int:
+        if self.approximate:
+            return self._distinct_values.estimate()
+        return len(self.qualitative_values)
+
+    '''
+    Return Metadata for the whole file estimated from this Metadata of a sample of its rows.
+    fraction: fraction of the file that was sampled
+    rows: number of rows in the sample
+    Counts are scaled by 1 / fraction, and intervals holds the confidence interval of each scaled count.
+    '''
+    def estimate(self, fraction:float, rows:int):
+        meta = Metadata(self.name, self.number, self.max_distinct, self.value_dictionary)
+        meta.sampled = True
+        meta.datatype = self.datatype
+        total = rows / fraction
+        for value, count in self.qualitative_values.items():
+            meta.qualitative_values[value] = round(count / fraction)
+            meta.intervals[value] = _confidence_interval(count, rows, total)
+        meta.quantitative_values_count = round(self.quantitative_values_count / fraction)
+        meta.quantitative_interval = _confidence_interval(self.quantitative_values_count, rows, total)
+        return meta
+
+    '''
+    Count an occurrence of a non numeric value
+    '''
+    def add_qualitative(self, value:str, count:int=1):
+        if self.approximate:
+            self._frequent_values.add(self.value_dictionary.intern(value), count)
+            self._distinct_values.add(value)
+        else:
+            current = self.qualitative_values.get(value)
+            if current is None:
+                self.qualitative_values[self.value_dictionary.intern(value)] = count
+            else:
+                self.qualitative_values[value] = current + count
+            if self.max_distinct is not None and len(self.qualitative_values) > self.max_distinct:
+                self._make_approximate()
+        self.datatype = _combine_datatypes(self.datatype, "qualitative")
+
+    '''
+    Count an occurrence of a numeric value
+    '''
+    def add_quantitative(self, count:int=1):
+        self.quantitative_values_count += count
+        self.datatype = _combine_datatypes(self.datatype, "quantitative")
+
+    '''
+    Remove occurrences of a non numeric value, such as one that was overwritten in the file.
+    Approximate counts can't have values removed.
+    '''
+    def remove_qualitative(self, value:str, count:int=1):
+        if self.approximate:
+            raise ValueError(f"Values can't be removed from the approximate counts of {self.name}.")
+        remaining = self.qualitative_values.get(value, 0) - count
+        if remaining > 0:
+            self.qualitative_values[value] = remaining
+        else:
+            self.qualitative_values.pop(value, None)
+        self._reset_datatype()
+
+    '''
+    Remove occurrences of a numeric value
+    '''
+    def remove_quantitative(self, count:int=1):
+        self.quantitative_values_count = max(self.quantitative_values_count - count, 0)
+        self._reset_datatype()
+
+    '''
+    Set the datatype from the counts, after values have been removed
+    '''
+    def _reset_datatype(self):
+        self.datatype = None
+        if self.qualitative_values:
+            self.datatype = "qualitative"
+        if self.quantitative_values_count:
+            self.datatype = _combine_datatypes(self.datatype, "quantitative")
+
+    '''
+    Add the counts of another Metadata object for the same column, such as one built from a later part of the file.
+    '''
+    def merge(self, other):
+        if other.approximate:
+            if not self.approximate:
+                self.max_distinct = other.max_distinct
+                self._make_approximate()
+            for value, count in other._frequent_values.counts.items():
+                self._frequent_values.add(self.value_dictionary.intern(value), count, other._frequent_values.errors[value])
+            self._distinct_values.merge(other._distinct_values)
+        else:
+            for value, count in other.qualitative_values.items():
+                self.add_qualitative(value, count)
+        self.quantitative_values_count += other.quantitative_values_count
+        self.datatype = _combine_datatypes(self.datatype, other.datatype)
+
+    def __repr__(self):
+        rep = f"<Metadata for column number {self.number}: {self.name}> datatype:{self.datatype}"
+        if self.approximate:
+            rep = rep + f"; qual_values_count:~{self.distinct_count()} (approximate)"
+        elif self.qualitative_values:
+            rep = rep + f"; qual_values_count:{len(self.qualitative_values.keys())}"
+        if self.quantitative_values_count:
+            rep = rep + f"; quant_values_count:{self.quantitative_values_count}"
+        if self.sampled:
+            rep = rep + " (sampled)"
+        return rep
+
+    def __str__(self):
+        report = self.__repr__()
+        if self.approximate:
+            report = report + f"\nMost Frequent Values ['Value': count] (approximate, counts may be over by up to {max(self._frequent_values.errors.values(), default=0)}): {self.qualitative_values}"
+        elif self.sampled and self.qualitative_values:
+            report = report + f"\nEstimated Values ['Value': count]: {self.qualitative_values}"
+            report = report + f"\nConfidence Intervals ['Value': (low, high)]: {self.intervals}"
+        elif self.qualitative_values:
+            report = report + f"\nQualitative Values ['Value': count]: {self.qualitative_values}"
+        return report
+
+    def __eq__(self, other):
+        return  self.name == other.name\
+            and self.number == other.number\
+            and self.qualitative_values == other.qualitative_values\
+            and self.quantitative_values_count == other.quantitative_values_count\
+            and self.datatype == other.datatype
+
+#suffix of the sidecar file that caches the metadata of a csv file
+CACHE_SUFFIX = ".metadata.json"
+CACHE_VERSION = 2
+'''
+    Return the path of the metadata cache for a csv file
+'''
+def _cache_path(file) -> str:
+    return str(file) + CACHE_SUFFIX
+'''
+    Return the hex digest of a file's contents
+'''
+def _file_hash(file, block_size:int=1024 * 1024) -> str:
+    digest = hashlib.blake2b()
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+'''
+    Return the values that a cached file must match for its metadata cache to be valid
+'''
+def _cache_key(file, reader_kwargs:dict, content_hash:bool, max_distinct:int=None) -> dict:
+    stat = os.stat(file)
+    return {
+        "version": CACHE_VERSION,
+        "path": os.path.abspath(file),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "hash": _file_hash(file) if content_hash else None,
+        "reader_kwargs": repr(sorted(reader_kwargs.items())),
+        "max_distinct": max_distinct,
+    }
+
+#suffix of the directory that stores the columns of a csv file in binary form
+COLUMN_STORE_SUFFIX = ".columns"
+'''
+    Return the path of the column store directory for a csv file
+'''
+def _column_store_path(file) -> str:
+    return str(file) + COLUMN_STORE_SUFFIX
+'''
+    Convert stripped values that the mask marks as numbers to floats, with nan for the other values.
+    Values such as "-" that pass _is_decimal but can't be converted are also nan.
+'''
+def _store_numbers(stripped:list, mask:list) -> array.array:
+    try:
+        return array.array("d", [float(number) if is_number else math.nan for number, is_number in zip(stripped, mask)])
+    except ValueError:
+        numbers = array.array("d")
+        for number, is_number in zip(stripped, mask):
+            try:
+                numbers.append(float(number) if is_number else math.nan)
+            except ValueError:
+                numbers.append(math.nan)
+        return numbers
+'''
+    Return a read only memoryview of a binary file with the given array typecode, memory mapped if it isn't empty
+'''
+def _map_array(path:str, typecode:str):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None, memoryview(array.array(typecode))
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return mapped, memoryview(mapped).cast(typecode)
+
+'''
+Class to read one column of a ColumnStore without parsing csv text.
+
+codes: memory mapped int32 codes of each row's value in dictionary.
+numbers: memory mapped float64 value of each row, nan where the value isn't a number, or None if the column has no numbers.
+'''
+class Column:
+    def __init__(self, directory:str, name:str, number:int, has_numbers:bool):
+        self.name = name
+        self.number = number
+        self._directory = directory
+        self._maps = []
+        mapped, self.codes = _map_array(os.path.join(directory, f"{number}.codes"), "i")
+        self._maps.append(mapped)
+        self.numbers = None
+        if has_numbers:
+            mapped, self.numbers = _map_array(os.path.join(directory, f"{number}.numbers"), "d")
+            self._maps.append(mapped)
+        self._dictionary = None
+        self._codes_by_value = None
+
+    '''
+    List of the distinct values of the column; a row's code is the index of its value
+    '''
+    @property
+    def dictionary(self) -> list:
+        if self._dictionary is None:
+            with open(os.path.join(self._directory, f"{self.number}.dictionary.json"), "r") as f:
+                self._dictionary = json.load(f)
+        return self._dictionary
+
+    '''
+    Return the code of a value, or None if the value isn't in the column
+    '''
+    def code(self, value:str):
+        if self._codes_by_value is None:
+            self._codes_by_value = {value: code for code, value in enumerate(self.dictionary)}
+        return self._codes_by_value.get(value)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, row:int) -> str:
+        return self.dictionary[self.codes[row]]
+
+    def __iter__(self):
+        dictionary = self.dictionary
+        return (dictionary[code] for code in self.codes)
+
+    def close(self):
+        self.codes.release()
+        if self.numbers is not None:
+            self.numbers.release()
+        for mapped in self._maps:
+            if mapped is not None:
+                mapped.close()
+
+'''
+Class to read the binary column store that a DataFile builds while profiling its csv file.
+Columns are memory mapped when they are first used, so queries only read the columns they touch.
+'''
+class ColumnStore:
+    def __init__(self, directory:str, manifest:dict):
+        self.directory = directory
+        self.rows = manifest["rows"]
+        #key: column header, value: (column number, has numbers)
+        self._layout = {name: (number, has_numbers) for name, number, has_numbers in manifest["columns"]}
+        self._columns = {}
+
+    '''
+    Open the column store of a csv file. Returns None if there is none or it doesn't match the file.
+    '''
+    @staticmethod
+    def open(file, reader_kwargs:dict):
+        directory = _column_store_path(file)
+        try:
+            with open(os.path.join(directory, "manifest.json"), "r") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("key") != _cache_key(file, reader_kwargs, False) or manifest.get("byteorder") != sys.byteorder:
+            return None
+        return ColumnStore(directory, manifest)
+
+    def __contains__(self, name:str):
+        return name in self._layout
+
+    '''
+    Return the Column for a header
+    '''
+    def column(self, name:str) -> Column:
+        if name not in self._columns:
+            number, has_numbers = self._layout[name]
+            self._columns[name] = Column(self.directory, name, number, has_numbers)
+        return self._columns[name]
+
+    def close(self):
+        for column in self._columns.values():
+            column.close()
+        self._columns = {}
+
+'''
+Class to write a ColumnStore. Values are added a column batch at a time during profiling.
+metas: Metadata objects of the columns to store.
+append: add rows to an existing store instead of replacing it.
+'''
+class _ColumnStoreWriter:
+    def __init__(self, file, metas:list, append:bool=False):
+        self.file = file
+        self.directory = _column_store_path(file)
+        self.rows = 0
+        self._names = {meta.number: meta.name for meta in metas} if not append else {}
+        self._dictionaries = {number: {} for number in self._names.keys()}
+        self._has_numbers = {number: False for number in self._names.keys()}
+        if append:
+            #only the columns already in the store are appended to
+            with open(os.path.join(self.directory, "manifest.json"), "r") as f:
+                manifest = json.load(f)
+            self.rows = manifest["rows"]
+            for name, number, has_numbers in manifest["columns"]:
+                with open(os.path.join(self.directory, f"{number}.dictionary.json"), "r") as f:
+                    self._dictionaries[number] = {value: code for code, value in enumerate(json.load(f))}
+                self._names[number] = name
+                self._has_numbers[number] = has_numbers
+        else:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            os.makedirs(self.directory)
+        self._rows_written = {number: self.rows for number in self._names.keys()}
+        mode = "ab" if append else "wb"
+        self._codes_files = {number: open(os.path.join(self.directory, f"{number}.codes"), mode) for number in self._names.keys()}
+        self._numbers_files = {}
+        for number, has_numbers in self._has_numbers.items():
+            if has_numbers:
+                self._numbers_files[number] = open(os.path.join(self.directory, f"{number}.numbers"), mode)
+
+    '''
+    Store a batch of values of a column. stripped and mask are the results of
+    _convert_to_decimal_strings and _decimal_mask for the values.
+    '''
+    def add_values(self, number:int, values:list, stripped:list, mask:list):
+        if number not in self._codes_files:
+            return
+        dictionary = self._dictionaries[number]
+        array.array("i", [dictionary.setdefault(value, len(dictionary)) for value in values]).tofile(self._codes_files[number])
+        if not self._has_numbers[number] and any(mask):
+            #the first number in the column, so fill in nan for the rows before it
+            self._has_numbers[number] = True
+            numbers_file = self._numbers_files[number] = open(os.path.join(self.directory, f"{number}.numbers"), "wb")
+            missing = self._rows_written[number]
+            for start in range(0, missing, PROFILE_BATCH_ROWS):
+                (array.array("d", [math.nan]) * min(PROFILE_BATCH_ROWS, missing - start)).tofile(numbers_file)
+        if self._has_numbers[number]:
+            _store_numbers(stripped, mask).tofile(self._numbers_files[number])
+        self._rows_written[number] += len(values)
+
+    '''
+    Write the dictionaries and manifest and return the finished ColumnStore
+    '''
+    def close(self, reader_kwargs:dict) -> ColumnStore:
+        for f in list(self._codes_files.values()) + list(self._numbers_files.values()):
+            f.close()
+        for number, dictionary in self._dictionaries.items():
+            with open(os.path.join(self.directory, f"{number}.dictionary.json"), "w") as f:
+                json.dump(list(dictionary.keys()), f)
+        manifest = {
+            "key": _cache_key(self.file, reader_kwargs, False),
+            "byteorder": sys.byteorder,
+            "rows": max(self._rows_written.values(), default=self.rows),
+            "columns": [(self._names[number], number, self._has_numbers[number]) for number in self._names.keys()],
+        }
+        with open(os.path.join(self.directory, "manifest.json.tmp"), "w") as f:
+            json.dump(manifest, f)
+        os.replace(os.path.join(self.directory, "manifest.json.tmp"), os.path.join(self.directory, "manifest.json"))
+        return ColumnStore(self.directory, manifest)
+
+'''
+Dictionary of column header to Metadata for a BaseFile that profiles some columns only when they are first used.
+Getting a pending column, or iterating the values or items, profiles the pending columns with a scan of the file.
+keys, len and in don't profile anything.
+
+pending: set of the headers whose Metadata hasn't been profiled yet
+'''
+class _LazyHeaders(dict):
+    def __init__(self, file):
+        super().__init__()
+        self._file = file
+        self.pending = set()
+
+    def __getitem__(self, header:str) -> Metadata:
+        if header in self.pending:
+            self._file._profile_columns([header])
+        return super().__getitem__(header)
+
+    def get(self, header:str, default=None):
+        return self[header] if header in self else default
+
+    def values(self):
+        self._profile_pending()
+        return super().values()
+
+    def items(self):
+        self._profile_pending()
+        return super().items()
+
+    def __eq__(self, other):
+        self._profile_pending()
+        if isinstance(other, _LazyHeaders):
+            other._profile_pending()
+        return super().__eq__(other)
+
+    def __repr__(self):
+        self._profile_pending()
+        return super().__repr__()
+
+    def _profile_pending(self):
+        if self.pending:
+            self._file._profile_columns(list(self.pending))
+
+    #pickled with dict.items, so pending columns stay pending instead of being profiled while the file is pickled
+    def __reduce__(self):
+        return (_LazyHeaders, (None,), self.__dict__, None, iter(dict.items(self)))
+
+    '''
+    Return the Metadata of every column without profiling the pending ones
+    '''
+    def metadata(self) -> list:
+        return list(super().values())
+
+    '''
+    Return the Metadata of the columns that have been profiled
+    '''
+    def profiled(self) -> list:
+        return [meta for meta in super().values() if meta.name not in self.pending]
+
+'''
+    Yield the rows of a csv reader until it has read line_num lines
+'''
+def _rows_until(reader, line_num:int):
+    if reader.line_num >= line_num:
+        return
+    for row in reader:
+        yield row
+        if reader.line_num >= line_num:
+            return
+
+#compression of files by suffix, used when compression is "infer"
+COMPRESSION_SUFFIXES = {".gz": "gzip", ".bz2": "bz2", ".xz": "xz"}
+_COMPRESSION_OPENERS = {"gzip": gzip.open, "bz2": bz2.open, "xz": lzma.open}
+'''
+    Return the compression of a file path: the given compression, or the one of its suffix if compression is "infer"
+'''
+def _compression_of(file, compression):
+    if compression == "infer":
+        return COMPRESSION_SUFFIXES.get(Path(file).suffix.lower()) if isinstance(file, (str, os.PathLike)) else None
+    if compression is not None and compression not in _COMPRESSION_OPENERS:
+        raise ValueError(f"{compression} is not a supported compression. Use one of {', '.join(_COMPRESSION_OPENERS.keys())}.")
+    return compression
+'''
+    Open a file path for reading text, decompressing it if compression is given
+'''
+def _open_text(file, compression:str=None, **kwargs):
+    if compression is None:
+        return open(file, "r", **kwargs)
+    return _COMPRESSION_OPENERS[compression](file, "rt", **kwargs)
+'''
+    Return a text stream that reads a binary or text stream, decompressing it if compression is given
+'''
+def _text_stream(stream, compression:str=None):
+    if compression is not None:
+        return _COMPRESSION_OPENERS[compression](stream, "rt")
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    return io.TextIOWrapper(stream)
 
-    def __repr__(self):
-        rep = f"<Metadata for column number {self.number}: {self.name}> datatype:{self.datatype}"
-        if self.qualitative_values:
-            rep = rep + f"; qual_values_count:{len(self.qualitative_values.keys())}"
-        if self.quantitative_values_count:
-            rep = rep + f"; quant_values_count:{self.quantitative_values_count}"
-        return rep
+'''
+Context manager for reading a stream once. On exit, a wrapper that was created around the caller's stream is
+detached or closed without closing the caller's stream.
+'''
+class _StreamReader:
+    def __init__(self, stream, wrapper:bool):
+        self.stream = stream
+        self.wrapper = wrapper
 
-    def __str__(self):
-        report = self.__repr__()
-        if self.qualitative_values:
-            report = report + f"\nQualitative Values ['Value': count]: {self.qualitative_values}"
-        return report
+    def __enter__(self):
+        return self.stream
 
-    def __eq__(self, other):
-        return  self.name == other.name\
-            and self.number == other.number\
-            and self.qualitative_values == other.qualitative_values\
-            and self.quantitative_values_count == other.quantitative_values_count\
-            and self.datatype == other.datatype
+    def __exit__(self, *exc_info):
+        if self.wrapper:
+            if isinstance(self.stream, io.TextIOWrapper) and not isinstance(self.stream.buffer, (gzip.GzipFile, bz2.BZ2File, lzma.LZMAFile)):
+                self.stream.detach()
+            else:
+                self.stream.close()
+        return False
 
 '''
 Class to track file information
 '''
 class BaseFile:
-    def __init__(self, file_path:str, *args, **kwargs):
+    '''
+    workers: number of processes to profile the file with. Files are split into byte ranges on record boundaries
+    and the Metadata of each range is merged, giving the same result as a serial scan.
+    cache: load the metadata from a sidecar file if the file hasn't changed since it was written, and write the
+    sidecar after profiling otherwise. The sidecar is keyed by the path, size and modification time of the file.
+    cache_hash: also key the sidecar by a hash of the file contents.
+    max_distinct: maximum number of distinct qualitative values counted exactly in each column (see Metadata).
+    columnar: open the ColumnStore of the file, building it during the profiling pass if it is missing or out of date.
+    Building a column store always profiles serially.
+    zone_map_rows: record a ZoneMap with blocks of this many rows while profiling. Recording one always profiles serially.
+    stats: Stats object that collects timings and counts of the DataFile's operations. Default is a disabled Stats object.
+    columns: list of the headers to profile. The other columns are profiled when they are first used.
+    lazy: only read the header row. Every column is profiled when it is first used, through headers or its attribute.
+    Columns profiled later are scanned up to the rows of the last scan, and aren't added to the column store or zone map.
+    compression: "gzip", "bz2", "xz" or None. Default is "infer", which uses the suffix of a file path (see COMPRESSION_SUFFIXES).
+    Compressed files are profiled serially, refresh profiles them again when they change, and they can't be updated.
+    sample_rows, sample_seconds: profile a random sample of blocks of the file until this many rows were read or this many
+    seconds passed, instead of the whole file. The Metadata are estimates flagged as sampled (see Metadata.estimate),
+    and upgrade_to_exact profiles the rest of the file. refresh samples a changed file again.
+    sample_seed: seed of the order the blocks are sampled in. Default is None (a different sample each time).
+    fast_path: memory map the file and split its lines on the delimiter, parsing only lines with quote characters with
+    csv.reader, and slicing out only the profiled columns. Files with a quoted field that holds a newline, compressed
+    files, streams, dialects it can't split and scans that build a column store or zone map use csv.reader, with the
+    same Metadata either way. Default is False.
+
+    file_path can also be a binary or text stream, such as the stdout of a subprocess, which is profiled in a single
+    pass. Its rows can't be read again, so it can't be cached, refreshed, updated, filtered or have relationships
+    scanned, and columns that weren't profiled in the pass can't be profiled later.
+    '''
+    def __init__(self, file_path:str, *args, workers:int=1, cache:bool=False, cache_hash:bool=False, max_distinct:int=None, columnar:bool=False, zone_map_rows:int=None, stats:Stats=None, columns:list=None, lazy:bool=False, compression:str="infer", sample_rows:int=None, sample_seconds:float=None, sample_seed:int=None, fast_path:bool=False, **kwargs):
+        self._compression = _compression_of(file_path, compression)
+        self._stream = None
+        if not isinstance(file_path, (str, os.PathLike)):
+            if cache or columnar or zone_map_rows or lazy:
+                raise ValueError("A stream is read once, so it can't be cached, lazy or have a column store or zone map.")
+            self._stream = _text_stream(file_path, self._compression)
+            self._source = file_path
+            file_path = None
+        elif self._compression is not None and zone_map_rows:
+            raise ValueError("Zone maps need byte offsets, so they can't be recorded for compressed files.")
+        #true while the metadata is estimated from a sample of the file
+        self.sampled = sample_rows is not None or sample_seconds is not None
+        if self.sampled and (self._stream is not None or self._compression is not None or cache or columnar or zone_map_rows or columns is not None or lazy):
+            raise ValueError("Sampling seeks to blocks of an uncompressed file, and can't be combined with cache, columnar, zone_map_rows, columns or lazy.")
+        self._sample_rows = sample_rows
+        self._sample_seconds = sample_seconds
+        self._sample_seed = sample_seed
+        self._sample = None
+        self._fast_path = fast_path
         self.file = file_path
+        self.stats = stats if stats is not None else Stats(enabled=False)
+        #set of the headers to profile when the file is scanned, or None for every header
+        self._projection = set(columns) if columns is not None else (set() if lazy else None)
+        self._reader_kwargs = kwargs
+        self._max_distinct = max_distinct
+        #interns the qualitative values of every column
+        self.value_dictionary = ValueDictionary()
+        self._cache = cache
+        self._cache_hash = cache_hash
+        self._columnar = columnar
+        self.column_store = ColumnStore.open(self.file, kwargs) if columnar else None
+        self._zone_map_rows = zone_map_rows
+        self.zone_map = None
         #key: column header, value: Metadata object
-        self.headers = {}
-        with open(self.file, "r") as f:
-            reader = csv.reader(f, **kwargs)
-            self._number_columns = -1
-            self._number_rows = 0
-            header_list = None
+        self.headers = _LazyHeaders(self)
+        self._number_columns = -1
+        self._number_rows = 0
+        #byte offset where the last scan ended, the last row it read and the inode of the scanned file
+        self._scan_offset = None
+        self._scan_last_row = None
+        self._scan_inode = None
+        with self.stats.timer("construct"):
+            if not (cache and self._load_cache(cache_hash)):
+                if self.sampled:
+                    self._sample_profile()
+                elif workers > 1 and not (columnar and self.column_store is None) and not zone_map_rows and self._compression is None and self.file is not None:
+                    self._parallel_profile(workers)
+                else:
+                    self._profile()
+                if cache:
+                    self._save_cache(cache_hash)
+                if self.stats.enabled:
+                    self.stats.bytes["profile"] = self.stats.bytes.get("profile", 0) + (self._scan_offset or 0)
+            else:
+                #the cache may not have the columns that are wanted now
+                wanted = self.headers.pending if self._projection is None else self.headers.pending & self._projection
+                if wanted:
+                    self._profile_columns(list(wanted))
+                if columnar and self.column_store is None:
+                    self.build_column_store()
+        self._set_column_attributes()
+
+    '''
+    For each value in headers, set an attribute with the same name as that header that returns the associated set.
+    Pending columns get their attribute when they are profiled (see __getattr__).
+    '''
+    def _set_column_attributes(self):
+        for value in self.headers.profiled():
+            setattr(self, value.name.replace(" ", "_"), value)
+
+    '''
+    Profile a pending column when its attribute is first used
+    '''
+    def __getattr__(self, name:str):
+        headers = self.__dict__.get("headers")
+        if headers is not None:
+            for header in list(headers.pending):
+                if header.replace(" ", "_") == name:
+                    return headers[header]
+        raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+
+    '''
+    Profile pending columns with one scan of the rows read by the last scan, or of the whole file if it hasn't been scanned
+    '''
+    def _profile_columns(self, names:list):
+        metas = [meta for meta in self.headers.metadata() if meta.name in names and meta.name in self.headers.pending]
+        if not metas:
+            return
+        with self.stats.timer("profile columns"), self._open() as f:
+            reader = csv.reader(f, **self._reader_kwargs)
             first_row = next(reader)
-            self._number_columns = len(first_row)
-            #populate dictionary for headers
-            for col in range(self._number_columns):
-                self.headers[first_row[col]] = Metadata(first_row[col], col)
-            header_list = list(self.headers.keys())
-            #next(reader)
-            #populate metadata for each column by analyzing each row in file
-            for row in reader:
-                #inner loop to check column values in row
-                for index in range(len(header_list)):
-                    header = header_list[index]
-                    value = row[index]
-                    meta = self.headers[header]
-                    #determine if row value is quantitative (numerical) or quantitative, and update Metadata.datatype
-                    if not _is_decimal(value):
-                        if value in meta.qualitative_values.keys():
-                            meta.qualitative_values[value] += 1
-                        else:
-                            meta.qualitative_values[value] = 1
-                        if meta.datatype is None:
-                            meta.datatype = "qualitative"
-                        elif meta.datatype == "quantitative":
-                            meta.datatype = "both"
-                    else:
-                        if meta.datatype is None:
-                            meta.datatype = "quantitative"
-                        elif meta.datatype == "qualitative":
-                            meta.datatype = "both"
-                        meta.quantitative_values_count += 1
+            if self._scan_offset is None:
+                last_row = _profile_rows(reader, metas, stats=self.stats.active())
+                self._number_rows = reader.line_num
+                self._set_scan_state(self._end_offset(f), last_row or first_row)
+            else:
+                _profile_rows(_rows_until(reader, self._number_rows), metas, stats=self.stats.active())
+        self.headers.pending.difference_update(meta.name for meta in metas)
+        if self._projection is not None:
+            self._projection.update(meta.name for meta in metas)
+        self._set_column_attributes()
+        if self._cache:
+            self._save_cache(self._cache_hash)
+
+    '''
+    Remember where a scan of the file ended so that refresh can continue from there
+    '''
+    def _set_scan_state(self, offset:int, last_row:list):
+        self._scan_offset = offset
+        self._scan_last_row = last_row
+        self._scan_inode = os.stat(self.file).st_ino if self.file is not None else None
+
+    '''
+    Return the byte offset where a scan that read to the end of f ended. For a compressed file this is the size of the
+    compressed file, and for a stream it is None.
+    '''
+    def _end_offset(self, f):
+        if self.file is None:
+            return None
+        if self._compression is not None:
+            return os.path.getsize(self.file)
+        return f.buffer.tell()
+
+    '''
+    Return a text file object for reading the rows of the file. A stream can only be opened once.
+    newline: passed to open
+    '''
+    def _open(self, **kwargs):
+        if self.file is not None:
+            return _open_text(self.file, self._compression, **kwargs)
+        if self._stream is None:
+            raise ValueError("The rows of a DataFile profiled from a stream can't be read again.")
+        stream = self._stream
+        self._stream = None
+        return _StreamReader(stream, stream is not self._source)
+
+    '''
+    Populate dictionary for headers from the first row of the file
+    '''
+    def _set_headers(self, first_row:list):
+        self._number_columns = len(first_row)
+        if self._projection is not None:
+            missing = self._projection.difference(first_row)
+            if missing:
+                raise ValueError(f"{', '.join(sorted(missing))} not a column of {self.file}.")
+        for col in range(self._number_columns):
+            self.headers[first_row[col]] = Metadata(first_row[col], col, self._max_distinct, self.value_dictionary)
+            if self._projection is not None and first_row[col] not in self._projection:
+                self.headers.pending.add(first_row[col])
+
+    '''
+    Populate metadata for each column by analyzing each row in file
+    '''
+    def _profile(self):
+        if self._fast_path and self._fast_profile():
+            return
+        zone_map = ZoneMap(self._zone_map_rows) if self._zone_map_rows else None
+        with self._open(**({"newline": ""} if zone_map is not None else {})) as f:
+            lines = f if zone_map is None else _CountingLines(f)
+            reader = csv.reader(lines, **self._reader_kwargs)
+            first_row = next(reader)
+            self._set_headers(first_row)
+            metas = self.headers.profiled()
+            if not metas:
+                #lazy, so the rows are left for the first column that is used
+                return
+            column_writer = None
+            if self._columnar and self.column_store is None:
+                column_writer = _ColumnStoreWriter(self.file, metas)
+            if zone_map is not None:
+                zone_map.start(lines)
+            last_row = _profile_rows(reader, metas, column_writer, zone_map, self.stats.active())
+            offset = self._end_offset(f) if zone_map is None else lines.bytes
+        self.zone_map = zone_map
         self._number_rows = reader.line_num
-        #For each value in headers, set an attribute with the same name as that header that returns the associated set
-        for header, value in self.headers.items():
-            setattr(self, header.replace(" ", "_"), value)
+        self._set_scan_state(offset, last_row or first_row)
+        if column_writer is not None:
+            self.column_store = column_writer.close(self._reader_kwargs)
+
+    '''
+    Profile the file with the fast path tokenizer (see _fast_batches). Returns false, with no headers set, if the file
+    has to be read with csv.reader instead.
+    '''
+    def _fast_profile(self) -> bool:
+        dialect = _fast_path_dialect(**self._reader_kwargs)
+        encoding = locale.getpreferredencoding(False)
+        if dialect is None or self.file is None or self._compression is not None or self._zone_map_rows or (self._columnar and self.column_store is None) or "\n".encode(encoding) != b"\n":
+            return False
+        with open(self.file, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return False
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                header_end = mapped.find(b"\n") + 1 or len(mapped)
+                header = mapped[:header_end].decode(encoding).replace("\r\n", "\n").replace("\r", "\n")
+                #lines that end in "\r" only are left to csv.reader
+                if "\n" in header[:-1]:
+                    return False
+                try:
+                    first_row, = _parse_lines([header[:-1] if header.endswith("\n") else header], self._reader_kwargs)
+                except _FastPathError:
+                    return False
+                self._set_headers(first_row)
+                metas = self.headers.profiled()
+                if not metas:
+                    #lazy, so the rows are left for the first column that is used
+                    return True
+                stats = self.stats.active()
+                batches = _fast_batches(self.file, mapped, header_end, self._number_columns, {meta.number for meta in metas}, self._reader_kwargs, dialect, encoding)
+                if stats is not None:
+                    batches = _timed(batches, stats, "tokenize")
+                rows = 0
+                line_num = 1
+                last_row = first_row
+                try:
+                    for columns, size, lines, last_row in batches:
+                        _profile_batch(columns, size, metas, stats=stats)
+                        rows += size
+                        line_num += lines
+                except _FastPathError:
+                    self.headers = _LazyHeaders(self)
+                    if stats is not None and rows:
+                        stats.rows["profile"] -= rows
+                    return False
+                end = len(mapped)
+        self._number_rows = line_num
+        self._set_scan_state(end, last_row)
+        return True
+
+    '''
+    Profile the file in byte ranges with a process pool and merge the results in file order.
+    Falls back to a serial scan for small files and dialects that can't be split. Ranges are split where the count
+    of quote characters is even, which a quote character inside an unquoted field throws off, so the file is also
+    profiled serially if a range didn't end outside of a quoted field and the next one didn't start on a record boundary.
+    '''
+    def _parallel_profile(self, workers:int):
+        try:
+            quotechar = _split_quotechar(**self._reader_kwargs)
+        except ValueError:
+            return self._profile()
+        size = os.path.getsize(self.file)
+        if size < PARALLEL_MIN_BYTES:
+            return self._profile()
+        header_end = _next_record_boundary(self.file, 0, 1, quotechar)
+        header_reader = _range_reader(self.file, 0, header_end, **self._reader_kwargs)
+        last_row = next(header_reader)
+        if next(header_reader, None) is not None:
+            return self._profile()
+        self._set_headers(last_row)
+        columns = [(meta.name, meta.number) for meta in self.headers.profiled()]
+        if not columns:
+            return
+        chunks = max(workers, -(-(size - header_end) // PARALLEL_CHUNK_BYTES))
+        ranges = _record_ranges(self.file, header_end, chunks, quotechar)
+        line_num = header_reader.line_num
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(_profile_range, [self.file] * len(ranges), *zip(*ranges),
+                                       [columns] * len(ranges), [self._reader_kwargs] * len(ranges), [self._max_distinct] * len(ranges))
+                for metas, lines, range_last_row, closed in results:
+                    if not closed:
+                        raise ValueError("A byte range ended inside a quoted field.")
+                    for meta in metas:
+                        self.headers[meta.name].merge(meta)
+                    line_num += lines
+                    last_row = range_last_row or last_row
+                    if self.stats.enabled:
+                        self.stats.add_rows("profile", lines)
+        #a range that started inside a quoted field, so the serial scan reports the error if the file itself is malformed
+        except (ValueError, IndexError, csv.Error):
+            self.headers = _LazyHeaders(self)
+            if self.stats.enabled and line_num > header_reader.line_num:
+                self.stats.rows["profile"] -= line_num - header_reader.line_num
+            return self._profile()
+        self._number_rows = line_num
+        self._set_scan_state(ranges[-1][1] if ranges else header_end, last_row)
+
+    '''
+    Profile random blocks of the file until the sample budget is spent, and set headers to Metadata estimated from them.
+    The file is split into blocks of SAMPLE_BLOCK_BYTES, and each block holds the records that start on a line in it.
+    A block whose rows don't all have a value for each header probably started inside a quoted field, so it isn't used.
+    Files that are read entirely and dialects that can't be split are profiled exactly.
+    '''
+    def _sample_profile(self):
+        try:
+            quotechar = _split_quotechar(**self._reader_kwargs)
+        except ValueError:
+            self.sampled = False
+            return self._profile()
+        started = time.perf_counter()
+        stats = self.stats.active()
+        size = os.path.getsize(self.file)
+        header_end = _next_record_boundary(self.file, 0, 1, quotechar)
+        header_reader = _range_reader(self.file, 0, header_end, **self._reader_kwargs)
+        first_row = next(header_reader)
+        self._set_headers(first_row)
+        columns = [(meta.name, meta.number) for meta in self.headers.values()]
+        sample = _Sample(header_end, header_reader.line_num, first_row, size, os.stat(self.file).st_ino)
+        blocks = -(-(size - header_end) // SAMPLE_BLOCK_BYTES)
+        with open(self.file, "rb") as f:
+            for block in random.Random(self._sample_seed).sample(range(blocks), blocks):
+                if sample.blocks and self._sample_rows is not None and sample.rows >= self._sample_rows:
+                    break
+                if sample.blocks and self._sample_seconds is not None and time.perf_counter() - started >= self._sample_seconds:
+                    break
+                start = _line_start(f, header_end + block * SAMPLE_BLOCK_BYTES) if block else header_end
+                end = _line_start(f, header_end + (block + 1) * SAMPLE_BLOCK_BYTES)
+                if end <= start:
+                    #a line longer than a block, which is read with the block it starts in
+                    continue
+                f.seek(start)
+                reader = csv.reader(io.TextIOWrapper(io.BytesIO(f.read(end - start))), **self._reader_kwargs)
+                try:
+                    rows = list(reader)
+                except csv.Error:
+                    continue
+                if any(len(row) != self._number_columns for row in rows):
+                    continue
+                metas = [Metadata(name, number, self._max_distinct, self.value_dictionary) for name, number in columns]
+                last_row = _profile_rows(rows, metas, stats=stats)
+                sample.blocks[start] = (end, metas, reader.line_num, last_row)
+                sample.rows += len(rows)
+                if stats is not None:
+                    stats.add_rows("sample", len(rows), end - start)
+        self._sample = sample
+        fraction = sample.fraction()
+        if fraction >= 1 or not sample.blocks:
+            return self._profile_exact()
+        self.sampled = True
+        for meta in sample.merged(columns, self._max_distinct, self.value_dictionary):
+            self.headers[meta.name] = meta.estimate(fraction, sample.rows)
+        lines = sum(lines for end, metas, lines, last_row in sample.blocks.values())
+        self._number_rows = sample.header_lines + round(lines / fraction)
+
+    '''
+    Replace the estimated metadata of a sampled file with exact metadata. The blocks read by sampling are reused,
+    so only the rest of the file is profiled. Does nothing if the metadata is already exact.
+    '''
+    def upgrade_to_exact(self):
+        if not self.sampled:
+            return
+        with self.stats.timer("upgrade"):
+            self._profile_exact()
+
+    '''
+    Profile the blocks of the file that weren't sampled and merge them with the sampled blocks in file order.
+    The whole file is profiled again if it changed since it was sampled, or if a sampled block didn't start and end
+    on record boundaries because a quoted field with a newline crossed them.
+    '''
+    def _profile_exact(self):
+        sample = self._sample
+        quotechar = _split_quotechar(**self._reader_kwargs)
+        size = os.path.getsize(self.file)
+        reuse = size == sample.size and os.stat(self.file).st_ino == sample.inode
+        if reuse and quotechar is not None:
+            offsets = [offset for start, (end, metas, lines, last_row) in sample.blocks.items() for offset in (start, end)]
+            reuse = all(quotes % 2 == 0 for quotes in _quote_counts(self.file, offsets, quotechar).values())
+        for header in self.headers.keys():
+            self.__dict__.pop(header.replace(" ", "_"), None)
+        columns = [(meta.name, meta.number) for meta in self.headers.values()]
+        self.headers = _LazyHeaders(self)
+        self.sampled = False
+        self._sample = None
+        if not reuse:
+            self._profile()
+            self._set_column_attributes()
+            return
+        stats = self.stats.active()
+        metas = [Metadata(name, number, self._max_distinct, self.value_dictionary) for name, number in columns]
+        line_num = sample.header_lines
+        last_row = sample.first_row
+        position = sample.header_end
+        for start in sorted(sample.blocks) + [size]:
+            if start > position:
+                lines, range_last_row = _profile_byte_range(self.file, position, start, metas, self._reader_kwargs, stats)
+                line_num += lines
+                last_row = range_last_row or last_row
+            if start == size:
+                break
+            position, block_metas, lines, block_last_row = sample.blocks[start]
+            for meta, block_meta in zip(metas, block_metas):
+                meta.merge(block_meta)
+            line_num += lines
+            last_row = block_last_row or last_row
+        for meta in metas:
+            self.headers[meta.name] = meta
+        self._number_rows = line_num
+        self._set_scan_state(size, last_row)
+        self._set_column_attributes()
+
+    '''
+    Load headers and counts from the metadata cache. Return false if there is no valid cache for the file.
+    '''
+    def _load_cache(self, content_hash:bool) -> bool:
+        try:
+            with open(_cache_path(self.file), "r") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if cached.get("key") != _cache_key(self.file, self._reader_kwargs, content_hash, self._max_distinct):
+            return False
+        #checked before any state is set, so a miss leaves the file to be profiled from scratch
+        if self._zone_map_rows and (cached.get("zone_map") is None or cached["zone_map"]["block_rows"] != self._zone_map_rows):
+            return False
+        self.headers = _LazyHeaders(self)
+        for values in cached["headers"]:
+            self.headers[values["name"]] = Metadata.from_dict(values, self.value_dictionary)
+        self.headers.pending.update(cached.get("pending", []))
+        self._number_rows = cached["number_rows"]
+        self._number_columns = cached["number_columns"]
+        self._set_scan_state(cached["scan_offset"], cached["scan_last_row"])
+        if self._zone_map_rows:
+            self.zone_map = ZoneMap.from_dict(cached["zone_map"])
+        return True
+
+    '''
+    Write headers and counts to the metadata cache, replacing any previous cache for the file.
+    '''
+    def _save_cache(self, content_hash:bool):
+        cached = {
+            "key": _cache_key(self.file, self._reader_kwargs, content_hash, self._max_distinct),
+            "headers": [meta.to_dict() for meta in self.headers.metadata()],
+            "pending": sorted(self.headers.pending),
+            "number_rows": self._number_rows,
+            "number_columns": self._number_columns,
+            "scan_offset": self._scan_offset,
+            "scan_last_row": self._scan_last_row,
+            "zone_map": self.zone_map.to_dict() if self.zone_map is not None else None,
+        }
+        cache_file = _cache_path(self.file)
+        with open(cache_file + ".tmp", "w") as f:
+            json.dump(cached, f)
+        os.replace(cache_file + ".tmp", cache_file)
+
+    '''
+    Return true if the data read by the last scan may have changed: the file was replaced or truncated,
+    or the last record that was scanned is different or wasn't complete when it was read.
+    '''
+    def _scan_changed(self, size:int) -> bool:
+        if self._scan_offset is None:
+            return True
+        if os.stat(self.file).st_ino != self._scan_inode or size < self._scan_offset:
+            return True
+        start = max(self._scan_offset - REFRESH_CHECK_BYTES, 0)
+        with open(self.file, "rb") as f:
+            f.seek(start)
+            tail = f.read(self._scan_offset - start)
+        if size > self._scan_offset and not tail.endswith((b"\n", b"\r")):
+            return True
+        if start > 0:
+            tail = tail[tail.find(b"\n") + 1:]
+        rows = list(csv.reader(io.TextIOWrapper(io.BytesIO(tail)), **self._reader_kwargs))
+        return not rows or rows[-1] != self._scan_last_row
+
+    '''
+    Profile the whole file again, replacing the current metadata and column store
+    '''
+    def _rescan(self):
+        for header in self.headers.keys():
+            self.__dict__.pop(header.replace(" ", "_"), None)
+        self.headers = _LazyHeaders(self)
+        if self.column_store is not None:
+            self.column_store.close()
+            self.column_store = None
+        if self.sampled:
+            self._sample_profile()
+        else:
+            self._profile()
+        self._set_column_attributes()
+
+    '''
+    Add the counts of rows appended to the file to the metadata, and their values to the column store
+    '''
+    def _add_rows(self, rows:list):
+        if self.column_store is None:
+            return _profile_rows(rows, self.headers.profiled(), stats=self.stats.active())
+        self.column_store.close()
+        column_writer = _ColumnStoreWriter(self.file, self.headers.profiled(), append=True)
+        last_row = _profile_rows(rows, self.headers.profiled(), column_writer, stats=self.stats.active())
+        self.column_store = column_writer.close(self._reader_kwargs)
+        return last_row
+
+    '''
+    Build the ColumnStore of the file with a separate scan, without profiling it again
+    '''
+    def build_column_store(self) -> ColumnStore:
+        metas = self.headers.profiled()
+        number_columns = max([meta.number for meta in metas], default=-1) + 1
+        column_writer = _ColumnStoreWriter(self.file, metas)
+        with self._open() as f:
+            reader = csv.reader(f, **self._reader_kwargs)
+            next(reader)
+            for batch in _batches(reader):
+                columns = _batch_columns(batch, number_columns)
+                for meta in metas:
+                    stripped = _convert_to_decimal_strings(columns[meta.number])
+                    column_writer.add_values(meta.number, columns[meta.number], stripped, _decimal_mask(columns[meta.number], stripped))
+        self.column_store = column_writer.close(self._reader_kwargs)
+        return self.column_store
+
+    '''
+    Close and delete the column store of the file, if there is one.
+    '''
+    def invalidate_column_store(self):
+        if self.column_store is not None:
+            self.column_store.close()
+            self.column_store = None
+        shutil.rmtree(_column_store_path(self.file), ignore_errors=True)
+
+    '''
+    Profile only the rows appended to the file since the last scan and merge them into the metadata.
+    Falls back to a full rescan if the file was truncated or rewritten.
+    A last row that doesn't end in a newline yet is left for the next refresh.
+    '''
+    def refresh(self):
+        if self.file is None:
+            raise ValueError("A DataFile profiled from a stream can't be refreshed.")
+        with self.stats.timer("refresh"):
+            self._refresh()
+
+    def _refresh(self):
+        size = os.path.getsize(self.file)
+        if self.sampled:
+            if self._sample.size == size and self._sample.inode == os.stat(self.file).st_ino:
+                return
+            self._rescan()
+        elif self._compression is not None:
+            #appended rows can't be found in compressed data, so a changed file is profiled again
+            if self._scan_offset == size and self._scan_inode == os.stat(self.file).st_ino:
+                return
+            self._rescan()
+        elif self._scan_changed(size):
+            self._rescan()
+        elif size > self._scan_offset:
+            try:
+                quotechar = _split_quotechar(**self._reader_kwargs)
+            except ValueError:
+                quotechar = None
+            with open(self.file, "rb") as f:
+                f.seek(self._scan_offset)
+                data = f.read(size - self._scan_offset)
+            end = _complete_records_end(data, quotechar, self._reader_kwargs)
+            if end == 0:
+                return
+            reader = csv.reader(io.TextIOWrapper(io.BytesIO(data[:end])), **self._reader_kwargs)
+            rows = list(reader)
+            last_row = self._add_rows(rows)
+            self._number_rows += reader.line_num
+            if self.stats.enabled:
+                self.stats.add_rows("refresh", len(rows), end)
+            if self.zone_map is not None:
+                lines = _CountingLines(io.TextIOWrapper(io.BytesIO(data[:end]), newline=""), self._scan_offset)
+                self.zone_map.add_rows(csv.reader(lines, **self._reader_kwargs), lines, self.headers.profiled())
+            self._set_scan_state(self._scan_offset + end, last_row or self._scan_last_row)
+        else:
+            return
+        if self._cache:
+            self._save_cache(self._cache_hash)
+
+    '''
+    Delete the metadata cache of the file, if there is one.
+    '''
+    def invalidate_cache(self):
+        try:
+            os.remove(_cache_path(self.file))
+        except FileNotFoundError:
+            pass
 
     '''
     Return a metadata summary for given column. If no column is provided, returns the summary for each column.
@@ -135,25 +2082,59 @@ class BaseFile:
 
 '''
 Class to define a relationship between a value in 1 column and values from another column
+
+related_counts: optional dictionary of related value to count, typically taken from a RelationshipIndex.
+If it is not provided, the file is scanned for the value.
+stats: optional Stats object that times the scan as the "relation" stage.
+compression: compression of the file (see BaseFile).
+
+The related values are kept as codes of the column's ValueDictionary in an array, with their counts in a parallel array.
 '''
 class Relation:
-    def __init__(self, value:str, column:Metadata, relational_column:Metadata, file:str):
+    __slots__ = ("value", "column_name", "column_number", "related_name", "related_number", "type", "value_dictionary", "_related_codes", "_counts")
+
+    def __init__(self, value:str, column:Metadata, relational_column:Metadata, file:str, related_counts:dict=None, stats:Stats=None, compression:str=None, **kwargs):
         if value not in column.qualitative_values:
             raise IndexError(f"{value} not a qualitative value of {column.name}.")
-        self.value = value
-        self.related_values = set()
+        self.value = column.value_dictionary.intern(value)
+        self.value_dictionary = column.value_dictionary
         self.column_name = column.name
         self.column_number = column.number
         self.related_name = relational_column.name
         self.related_number = relational_column.number
         self.type = None
-        with open(file, "r") as f:
-            reader = csv.reader(f)
-            next(reader)
-            for row in reader:
-                if row[self.column_number] == self.value:
-                    self.related_values.add(row[relational_column.number])
-        self.type = f"one to {len(self.related_values)}"
+        if related_counts is None:
+            related_counts = {}
+            if file is None:
+                raise ValueError("The rows of a DataFile profiled from a stream can't be read again.")
+            with (stats.timer("relation") if stats is not None else nullcontext()), _open_text(file, compression) as f:
+                reader = csv.reader(f, **kwargs)
+                next(reader)
+                for row in reader:
+                    if row[self.column_number] == self.value:
+                        related_value = row[relational_column.number]
+                        related_counts[related_value] = related_counts.get(related_value, 0) + 1
+                if stats is not None and stats.enabled:
+                    stats.add_rows("relation", reader.line_num - 1)
+        self._related_codes = array.array("q", map(self.value_dictionary.encode, related_counts.keys()))
+        self._counts = array.array("q", related_counts.values())
+        self.type = f"one to {len(self._related_codes)}"
+
+    '''
+    Dictionary; key is related value, value is count of rows with both values
+    '''
+    @property
+    def related_counts(self) -> dict:
+        values = self.value_dictionary.values
+        return {values[code]: count for code, count in zip(self._related_codes, self._counts)}
+
+    '''
+    Set of the values in the related column on rows with the value
+    '''
+    @property
+    def related_values(self) -> set:
+        values = self.value_dictionary.values
+        return set(values[code] for code in self._related_codes)
 
     def __str__(self):
         return f"<Relation between {self.value} from {self.column_name} and {self.related_name}> {self.type}."
@@ -165,12 +2146,366 @@ class Relation:
         return  self.value == other.value\
             and self.related_values == other.related_values\
             and self.column_name == other.column_name\
-            and self.column_numebr == other.column_number\
+            and self.column_number == other.column_number\
             and self.related_name == other.related_name\
             and self.related_number == other.related_number\
             and self.type == other.type
 
+'''
+Class to index co-occurring values between pairs of columns, built in a single pass over the rows.
+
+For each (column1, column2) pair the index maps every value of column1 to a dictionary of
+the column2 values seen on the same rows and how many rows they share.
+'''
+class RelationshipIndex:
+    def __init__(self, value_dictionary:ValueDictionary=None):
+        #key: (column1 name, column2 name), value: dictionary of column1 value to {column2 value: count}
+        self.pairs = {}
+        self._numbers = {}
+        #interns the related values of the tables, which repeat for each value of column1
+        self.value_dictionary = value_dictionary if value_dictionary is not None else ValueDictionary()
+
+    '''
+    Add column pairs to the index. Pairs that are already indexed are ignored.
+    Returns the list of pairs that were added and still need rows.
+    '''
+    def add_pairs(self, *column_pairs:tuple):
+        added = []
+        for column, relational_column in column_pairs:
+            key = (column.name, relational_column.name)
+            if key in self.pairs:
+                continue
+            self.pairs[key] = {}
+            self._numbers[key] = (column.number, relational_column.number)
+            added.append(key)
+        return added
+
+    '''
+    Update the co-occurrence counts of the given pairs (all pairs by default) with rows from a csv reader.
+    '''
+    def add_rows(self, rows, pairs=None):
+        if pairs is None:
+            pairs = list(self.pairs.keys())
+        specs = [(self._numbers[key][0], self._numbers[key][1], self.pairs[key]) for key in pairs]
+        intern = self.value_dictionary.intern
+        for row in rows:
+            for left, right, table in specs:
+                related = table.get(row[left])
+                if related is None:
+                    related = table[row[left]] = {}
+                related_value = row[right]
+                count = related.get(related_value)
+                if count is None:
+                    related[intern(related_value)] = 1
+                else:
+                    related[related_value] = count + 1
+
+    '''
+    Fill the co-occurrence counts of an added pair from two Column objects of a ColumnStore, without reading the csv file.
+    '''
+    def add_columns(self, key:tuple, column:Column, relational_column:Column):
+        table = self.pairs[key]
+        left_values = column.dictionary
+        right_values = [self.value_dictionary.intern(value) for value in relational_column.dictionary]
+        for (left_code, right_code), count in Counter(zip(column.codes, relational_column.codes)).items():
+            related = table.get(left_values[left_code])
+            if related is None:
+                related = table[left_values[left_code]] = {}
+            related[right_values[right_code]] = related.get(right_values[right_code], 0) + count
+
+    '''
+    Move the counts of rows that were changed from their old values to their new values.
+    old_rows and new_rows are lists of the same rows before and after the change.
+    '''
+    def replace_rows(self, old_rows:list, new_rows:list):
+        for key, (left, right) in self._numbers.items():
+            table = self.pairs[key]
+            changed = []
+            for old_row, new_row in zip(old_rows, new_rows):
+                if old_row[left] == new_row[left] and old_row[right] == new_row[right]:
+                    continue
+                changed.append(new_row)
+                related = table.get(old_row[left], {})
+                if related.get(old_row[right], 0) > 1:
+                    related[old_row[right]] -= 1
+                elif old_row[right] in related:
+                    del related[old_row[right]]
+                    if not related:
+                        del table[old_row[left]]
+            self.add_rows(changed, [key])
+
+    def __contains__(self, key):
+        return key in self.pairs
+
+    '''
+    Return the dictionary of related values and counts for a value in column1.
+    '''
+    def related(self, value, column1:str, column2:str) -> dict:
+        return self.pairs[(column1, column2)].get(value, {})
+
+#number of groups DataFile.group_by keeps in memory before it spills their partial aggregates to disk
+GROUP_BY_MAX_GROUPS = 1000000
+#number of partitions that spilled data is split into by the hash of its key
+SPILL_PARTITIONS = 16
+#aggregate functions of DataFile.group_by
+AGGREGATES = ("count", "sum", "mean", "min", "max", "distinct")
+'''
+    Return the aggregate state of a new group: its number of rows, then for each aggregated column the count, sum,
+    minimum and maximum of the column's numbers and the set of its distinct numbers (None if distinct isn't wanted).
+'''
+def _new_group_state(distinct:list) -> list:
+    state = [0]
+    for wanted in distinct:
+        state += [0, 0, None, None, set() if wanted else None]
+    return state
+'''
+    Add the aggregate state of the same group from another partial aggregation
+'''
+def _merge_group_states(state:list, other:list):
+    state[0] += other[0]
+    for slot in range(1, len(state), 5):
+        state[slot] += other[slot]
+        state[slot + 1] += other[slot + 1]
+        if other[slot + 2] is not None:
+            state[slot + 2] = other[slot + 2] if state[slot + 2] is None else min(state[slot + 2], other[slot + 2])
+            state[slot + 3] = other[slot + 3] if state[slot + 3] is None else max(state[slot + 3], other[slot + 3])
+        if state[slot + 4] is not None:
+            state[slot + 4].update(other[slot + 4])
+'''
+    Return the result row of a group from its key and aggregate state
+'''
+def _group_result(by:list, aggregates:list, key:tuple, state:list) -> dict:
+    result = dict(zip(by, key))
+    result["count"] = state[0]
+    for position, (column, functions) in enumerate(aggregates):
+        count, total, minimum, maximum, distinct = state[1 + 5 * position:6 + 5 * position]
+        values = {"count": count, "sum": total, "mean": total / count if count else None, "min": minimum, "max": maximum}
+        for function in functions:
+            result[f"{function}({column})"] = len(distinct) if function == "distinct" else values[function]
+    return result
+'''
+    Pickle (key, value) items into spill files, choosing each item's file by the hash of its key
+'''
+def _spill(items, files:list):
+    partitions = [[] for _ in files]
+    for key, value in items:
+        partitions[hash(key) % len(files)].append((key, value))
+    for f, partition in zip(files, partitions):
+        if partition:
+            pickle.dump(partition, f, pickle.HIGHEST_PROTOCOL)
+'''
+    Yield each list of items pickled into a spill file
+'''
+def _read_spill(f):
+    f.seek(0)
+    while True:
+        try:
+            yield pickle.load(f)
+        except EOFError:
+            return
+
+#number of rows of the build side that DataFile.join keeps in memory before it falls back to a grace hash join
+JOIN_MAX_BUILD_ROWS = 1000000
+'''
+    Return a function that returns a tuple of the values at the given column numbers of a row
+'''
+def _row_getter(numbers:list):
+    if len(numbers) == 1:
+        number = numbers[0]
+        return lambda row: (row[number],)
+    if not numbers:
+        return lambda row: ()
+    return operator.itemgetter(*numbers)
+'''
+    Yield (key, values) for each row of a DataFile, where key is the tuple of the values of the key columns and values
+    is the row, or the tuple of the values of the value columns if value_numbers is given
+'''
+def _keyed_rows(data, key_numbers:list, value_numbers:list=None):
+    key = _row_getter(key_numbers)
+    values = _row_getter(value_numbers) if value_numbers is not None else None
+    with data._open() as f:
+        reader = csv.reader(f, **data._reader_kwargs)
+        next(reader)
+        for row in reader:
+            yield key(row), row if values is None else values(row)
+'''
+    Yield the joined rows of a build side and a probe side, which are iterables of (key, values).
+    build_left: the build side has the rows of the left file, so joined rows are its values and then the probe's values
+    left_outer: also yield the left rows without a match, with right_width empty values
+'''
+def _hash_join(build, probe, build_left:bool, left_outer:bool, right_width:int):
+    table = {}
+    for key, values in build:
+        rows = table.get(key)
+        if rows is None:
+            table[key] = [values]
+        else:
+            rows.append(values)
+    empty = ("",) * right_width
+    if not build_left:
+        for key, left in probe:
+            rights = table.get(key)
+            if rights is not None:
+                for right in rights:
+                    yield [*left, *right]
+            elif left_outer:
+                yield [*left, *empty]
+        return
+    matched = set()
+    for key, right in probe:
+        lefts = table.get(key)
+        if lefts is not None:
+            matched.add(key)
+            for left in lefts:
+                yield [*left, *right]
+    if left_outer:
+        for key, lefts in table.items():
+            if key not in matched:
+                for left in lefts:
+                    yield [*left, *empty]
+
+#number of rows DataFile.sort sorts in memory at a time. Longer files are sorted in runs spilled to temporary files.
+SORT_RUN_ROWS = 500000
+#number of sorted runs merged at once
+SORT_MERGE_RUNS = 64
+'''
+    Return the sort key of each row from the values of the columns to sort by. Numbers are (tag, number) and other
+    values of numeric columns are (tag, value), with the tags chosen so that numbers come first in either direction.
+    columns: list of the values of each sort column
+    numeric: list that is true for each sort column ordered as numbers
+'''
+def _sort_keys(columns:list, numeric:list, descending:bool) -> list:
+    number_tag, other_tag = (1, 0) if descending else (0, 1)
+    parts = []
+    for values, is_numeric in zip(columns, numeric):
+        if not is_numeric:
+            parts.append(values)
+            continue
+        mask, numbers = classify_values(values)
+        parts.append([(number_tag, number) if is_number else (other_tag, value) for value, number, is_number in zip(values, numbers, mask)])
+    return list(zip(*parts))
+'''
+    Yield (sort keys, rows) for each batch of rows of a DataFile
+'''
+def _key_batches(data, key_numbers:list, numeric:list, descending:bool):
+    number_columns = max(key_numbers) + 1
+    with data._open() as f:
+        reader = csv.reader(f, **data._reader_kwargs)
+        next(reader)
+        for batch in _batches(reader):
+            columns = _batch_columns(batch, number_columns)
+            yield _sort_keys([columns[number] for number in key_numbers], numeric, descending), batch
+'''
+    Pickle sorted (key, row) items into a new temporary file and return it
+'''
+def _write_run(items):
+    f = tempfile.TemporaryFile()
+    for batch in _batches(items):
+        pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+    return f
+'''
+    Merge sorted runs written by _write_run into one sorted iterator of (key, row) items
+'''
+def _merge_runs(runs:list, descending:bool):
+    return heapq.merge(*[chain.from_iterable(_read_spill(run)) for run in runs], key=operator.itemgetter(0), reverse=descending)
+
+'''
+Class for one rule of DataFile.update_values: replace old_value with new_value in the given columns, in the rows where
+each column in conditions equals its value. As in DataFile.update_value, numbers in the file are compared with old_value
+as numbers, so 75000 matches "75,000", and with conditions as decimal strings, so "75000" matches "75,000".
+'''
+class UpdateRule:
+    def __init__(self, old_value, new_value, columns, conditions:dict=None):
+        self.old_value = old_value
+        self.new_value = new_value
+        self.columns = [columns] if isinstance(columns, str) else list(columns)
+        self.conditions = dict(conditions or {})
+        #the value as csv.writer writes it
+        self.written_value = "" if new_value is None else str(new_value)
+
+    '''
+    Yield (row index, column name) for each value in a batch of rows that the rule changes.
+    column_numbers is a dictionary of column name to column number.
+    '''
+    def changes(self, batch:list, column_numbers:dict):
+        alter_rows = [True] * len(batch)
+        for column, val in self.conditions.items():
+            actual_values = [row[column_numbers[column]] for row in batch]
+            stripped = _convert_to_decimal_strings(actual_values)
+            mask = _decimal_mask(actual_values, stripped)
+            for index in range(len(batch)):
+                actual_value = stripped[index] if mask[index] else actual_values[index]
+                if actual_value != val:
+                    alter_rows[index] = False
+        indexes = list(compress(range(len(batch)), alter_rows))
+        for column in self.columns:
+            current_values = [batch[index][column_numbers[column]] for index in indexes]
+            mask, numbers = classify_values(current_values)
+            for position, index in enumerate(indexes):
+                current_value = numbers[position] if mask[position] else current_values[position]
+                if current_value == self.old_value:
+                    yield index, column
+
+#number of query results a DataFile keeps by default
+QUERY_CACHE_ENTRIES = 256
+'''
+    Return the (size, modification time, inode) of a file, which changes whenever the file is written or replaced
+'''
+def _file_state(file) -> tuple:
+    stat = os.stat(file)
+    return (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+'''
+Class to keep the results of repeated queries, evicting the least recently used result when it is full.
+
+Keys are (query kind, columns, value or predicate, file version) tuples, so a result is only found again for the same
+question about the same version of the file.
+max_entries: number of results kept. 0 keeps none.
+hits, misses: number of lookups that found a result and that computed one
+evictions: number of results dropped to make room for newer ones
+'''
+class QueryCache:
+    def __init__(self, max_entries:int=QUERY_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    '''
+    Return the result kept for key, or call compute to get it and keep it
+    '''
+    def get(self, key:tuple, compute):
+        if key in self._results:
+            self.hits += 1
+            self._results.move_to_end(key)
+            return self._results[key]
+        self.misses += 1
+        result = compute()
+        if self.max_entries > 0:
+            self._results[key] = result
+            if len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+                self.evictions += 1
+        return result
+
+    '''
+    Drop every result, keeping the hit and miss counts
+    '''
+    def clear(self):
+        self._results.clear()
+
+    '''
+    Return a dictionary of the hit, miss and eviction counts and the number of results kept
+    '''
+    def info(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "entries": len(self._results), "max_entries": self.max_entries}
+
+    def __contains__(self, key:tuple):
+        return key in self._results
 
+    def __len__(self):
+        return len(self._results)
 
 '''
 Class to represent a csv file with data in it
@@ -179,15 +2514,40 @@ class DataFile(BaseFile):
     '''
     Ensures that file exists and stores column names and unique non numeric row values.
 
-    file_path: string descripting path to csv file to read
+    file_path: string descripting path to csv file to read, which may be compressed, or a binary or text stream (see BaseFile)
     file_type: passed to csv.reader as dialect parameter. Default is excel.
+    workers: number of processes used to profile the file. Default is 1 (no process pool).
+    cache: load and save the metadata in a sidecar file next to the csv file. Default is False.
+    cache_hash: include a hash of the file contents in the sidecar key. Default is False.
+    columnar: keep a memory mapped binary copy of the columns next to the csv file (see ColumnStore), which
+    relationship queries read instead of parsing the csv file. Default is False.
+    max_distinct: maximum number of distinct qualitative values counted exactly in each column. Columns with more
+    keep approximate counts of their most frequent values. Default is None (no limit).
+    zone_map_rows: record a ZoneMap with blocks of this many rows, which lets Filter skip blocks. Default is None (no zone map).
+    stats: Stats object that times the stages of profiling, relationships, updates and filters. Default is disabled.
+    columns: list of the columns to profile in the first scan. Other columns are profiled when they are first used.
+    lazy: only read the header. Columns are profiled when they are first used, through headers or their attributes.
+    compression: "gzip", "bz2", "xz" or None. Default is "infer", from the suffix of the file path.
+    sample_rows: estimate the metadata from random blocks of the file with about this many rows. Default is None (exact).
+    sample_seconds: estimate the metadata from the random blocks that can be read in this many seconds. Default is None.
+    sample_seed: seed of the order the blocks are sampled in. Default is None.
+    fast_path: split the lines of the memory mapped file without csv.reader where they have no quoted newlines. Default is False.
+    query_cache_size: number of relationship and filter count results kept in query_cache (see QueryCache). Results
+    are dropped when the DataFile is updated or refreshed, and a query on a file that changed on disk refreshes it first.
+    Default is QUERY_CACHE_ENTRIES.
     **kwargs: passed to csv.reader as format parameters. See python csv.
     '''
-    def __init__(self, file_path:str, *args, **kwargs):
-        if not os.path.isfile(file_path):
+    def __init__(self, file_path:str, *args, workers:int=1, cache:bool=False, cache_hash:bool=False, max_distinct:int=None, columnar:bool=False, zone_map_rows:int=None, stats:Stats=None, columns:list=None, lazy:bool=False, compression:str="infer", sample_rows:int=None, sample_seconds:float=None, sample_seed:int=None, fast_path:bool=False, query_cache_size:int=QUERY_CACHE_ENTRIES, **kwargs):
+        if isinstance(file_path, (str, os.PathLike)) and not os.path.isfile(file_path):
             raise FileNotFoundError(f"{file_path} does not exist.")
-        super().__init__(file_path)
+        super().__init__(file_path, *args, workers=workers, cache=cache, cache_hash=cache_hash, max_distinct=max_distinct, columnar=columnar, zone_map_rows=zone_map_rows, stats=stats, columns=columns, lazy=lazy, compression=compression, sample_rows=sample_rows, sample_seconds=sample_seconds, sample_seed=sample_seed, fast_path=fast_path, **kwargs)
+        #key: value, value: the last Relation returned for it
         self.relationships = {}
+        self.relationship_index = RelationshipIndex(self.value_dictionary)
+        self.query_cache = QueryCache(query_cache_size)
+        #incremented whenever the rows of the file change, so cached results of older versions aren't found
+        self._version = 0
+        self._file_state = _file_state(self.file) if self.file is not None else None
     '''
     Wrapper for __init__ for performance benchmarking.
     '''
@@ -195,7 +2555,7 @@ class DataFile(BaseFile):
         return DataFile(*args, **kwargs)
 
     def __repr__(self):
-        rep = f"DataFile {self.file}: {self._number_rows} rows; {self._number_columns} columns'\n'Headers:"
+        rep = f"DataFile {self.file}: {'~' if self.sampled else ''}{self._number_rows} rows; {self._number_columns} columns'\n'Headers:"
         for header, values in self.headers.items():
             rep = rep + f"\n<{header}>: {values.__repr__()}"
         return rep
@@ -208,22 +2568,130 @@ class DataFile(BaseFile):
         return super().__eq__(other) and self.relationships == other.relationships
 
     '''
-    Return relationship information between two columns
+    Add appended rows to the metadata and the relationship index, and rebuild the relationships from them
+    '''
+    def _add_rows(self, rows:list):
+        last_row = super()._add_rows(rows)
+        self.relationship_index.add_rows(rows)
+        self._rebuild_relationships()
+        return last_row
+
+    '''
+    Profile the whole file again and rebuild the relationship index and relationships that have been run
+    '''
+    def _rescan(self):
+        super()._rescan()
+        pairs = [pair for pair in self.relationship_index.pairs.keys() if pair[0] in self.headers and pair[1] in self.headers]
+        self.relationship_index = RelationshipIndex(self.value_dictionary)
+        self.build_relationship_index(*pairs)
+        self._rebuild_relationships()
+
+    '''
+    Replace the estimated metadata with exact metadata (see BaseFile.upgrade_to_exact) and recompute the relationships from it
+    '''
+    def upgrade_to_exact(self):
+        super().upgrade_to_exact()
+        self._rebuild_relationships()
+
+    '''
+    Drop the cached query results, since the rows of the file changed
+    '''
+    def _invalidate_queries(self):
+        self._version += 1
+        self.query_cache.clear()
+        self._file_state = _file_state(self.file) if self.file is not None else None
+
+    '''
+    Refresh the file if it changed on disk since the cached query results were computed
+    '''
+    def _check_file_changed(self):
+        if self.file is not None and _file_state(self.file) != self._file_state:
+            self.refresh()
+            self._invalidate_queries()
+
+    '''
+    Recompute each relationship in self.relationships, dropping values that are no longer in their column.
+    This runs whenever the rows of the file changed, so the cached query results are dropped too.
+    '''
+    def _rebuild_relationships(self):
+        self._invalidate_queries()
+        for value, relation in list(self.relationships.items()):
+            column = self.headers.get(relation.column_name)
+            if column is None or relation.related_name not in self.headers or value not in column.qualitative_values:
+                del self.relationships[value]
+                continue
+            self.get_relationship(value, relation.column_name, relation.related_name)
+
+    '''
+    Build the relationship index for one or more (column1, column2) pairs in a single scan of the file.
+    Pairs that are already indexed are not scanned again.
+    '''
+    def build_relationship_index(self, *column_pairs:tuple) -> RelationshipIndex:
+        with self.stats.timer("relationships"):
+            return self._build_relationship_index(*column_pairs)
+
+    def _build_relationship_index(self, *column_pairs:tuple) -> RelationshipIndex:
+        pairs = [(self.headers[column1], self.headers[column2]) for column1, column2 in column_pairs]
+        added = self.relationship_index.add_pairs(*pairs)
+        store = self.column_store
+        from_store = [key for key in added if store is not None and key[0] in store and key[1] in store]
+        for key in from_store:
+            self.relationship_index.add_columns(key, store.column(key[0]), store.column(key[1]))
+        from_file = [key for key in added if key not in from_store]
+        if from_file:
+            with self._open() as f:
+                reader = csv.reader(f, **self._reader_kwargs)
+                next(reader)
+                self.relationship_index.add_rows(reader, from_file)
+                if self.stats.enabled:
+                    self.stats.add_rows("relationships", reader.line_num - 1, f.buffer.tell())
+        return self.relationship_index
+
+    '''
+    Return a dictionary of value to Relation for each qualitative value of column1 with column2
     '''
     def get_relationships(self, column1:str, column2:str) -> dict:
+        self._check_file_changed()
+        relationships = self.query_cache.get(("relationships", (column1, column2), None, self._version), lambda: self._get_relationships(column1, column2))
+        self.relationships.update(relationships)
+        return relationships
+
+    def _get_relationships(self, column1:str, column2:str) -> dict:
         left_col = self.headers[column1]
         right_col = self.headers[column2]
+        index = self.build_relationship_index((column1, column2))
+        relationships = {}
         for value in left_col.qualitative_values:
-            self.relationships[value] = Relation(value, left_col, right_col, self.file)
-        return self.relationships
+            related_counts = index.related(value, column1, column2)
+            relationships[value] = Relation(value, left_col, right_col, self.file, related_counts)
+        return relationships
     '''
     Return Relation between given value in given column with another column
     '''
     def get_relationship(self, value, column1:str, column2:str):
+        self._check_file_changed()
+        relation = self.query_cache.get(("relationship", (column1, column2), value, self._version), lambda: self._get_relationship(value, column1, column2))
+        self.relationships[value] = relation
+        return relation
+
+    def _get_relationship(self, value, column1:str, column2:str):
         left_col = self.headers[column1]
         right_col = self.headers[column2]
-        relation = Relation(value, left_col, right_col, self.file)
-        self.relationships[value] = relation
+        store = self.column_store
+        if (column1, column2) in self.relationship_index:
+            related_counts = self.relationship_index.related(value, column1, column2)
+            relation = Relation(value, left_col, right_col, self.file, related_counts)
+        elif store is not None and column1 in store and column2 in store:
+            column = store.column(column1)
+            related = store.column(column2)
+            code = column.code(value)
+            related_counts = {}
+            if code is not None:
+                for related_code, count in Counter(compress(related.codes, map(code.__eq__, column.codes))).items():
+                    related_counts[related.dictionary[related_code]] = count
+            relation = Relation(value, left_col, right_col, self.file, related_counts)
+        else:
+            relation = Relation(value, left_col, right_col, self.file, stats=self.stats, compression=self._compression, **self._reader_kwargs)
         return relation
 
     '''
@@ -231,59 +2699,440 @@ class DataFile(BaseFile):
     Useful for replacing qualitative that should be a quantifiable number.
     '''
     def update_value(self, old_value, new_value, *columns, new_file_name=None, **column_value):
+        return self.update_values([UpdateRule(old_value, new_value, columns, column_value)], new_file_name=new_file_name)
+
+    '''
+    Apply a list of UpdateRule objects (or (old_value, new_value, columns, conditions) tuples) to the file in a
+    single pass. Rules are applied to each row in order, so a rule sees the values written by the rules before it.
+    The file is written to a temporary file that replaces the output file. When the file is updated in place,
+    the metadata and the relationship index are adjusted for the changed values instead of profiling the file again.
+    Returns the number of values changed.
+    '''
+    def update_values(self, rules:list, new_file_name=None):
+        with self.stats.timer("update"):
+            return self._update_values(rules, new_file_name)
+
+    def _update_values(self, rules:list, new_file_name=None):
+        if self.file is None:
+            raise ValueError("A DataFile profiled from a stream can't be updated.")
+        if self._compression is not None and not new_file_name:
+            raise ValueError(f"{self.file} is compressed, so its updated rows have to be written to a new_file_name.")
+        if self.sampled:
+            raise ValueError(f"The metadata of {self.file} is estimated from a sample. Call upgrade_to_exact before updating it.")
+        rules = [rule if isinstance(rule, UpdateRule) else UpdateRule(*rule) for rule in rules]
         in_file = Path(self.file).resolve()
         out_file = self.file
         directory = os.path.dirname(self.file)
         if new_file_name:
             out_file = directory + "/" + new_file_name
             out_file = Path(out_file).resolve()
+        for rule in rules:
+            for column in list(rule.columns) + list(rule.conditions.keys()):
+                if column not in self.headers.keys():
+                    print(f"{column} is not a valid column.")
+                    return
+        in_place = Path(out_file).resolve() == in_file
+        #the metadata cache and column store of the file being written no longer match its contents
+        if os.path.isfile(_cache_path(out_file)):
+            os.remove(_cache_path(out_file))
+        if in_place:
+            self.invalidate_column_store()
+        shutil.rmtree(_column_store_path(out_file), ignore_errors=True)
+        column_numbers = {meta.name: meta.number for meta in self.headers.metadata()}
+        removed = {column: Counter() for column in self.headers.keys()}
+        added = {column: Counter() for column in self.headers.keys()}
+        old_rows = []
+        new_rows = []
+        changed = 0
+        with self._open() as real_file, tempfile.NamedTemporaryFile(mode="w", dir=Path(out_file).parent, delete=False, newline="", suffix=".tmp") as temp_csv:
+            try:
+                reader = csv.reader(real_file, **self._reader_kwargs)
+                writer = csv.writer(temp_csv, **self._reader_kwargs)
+                last_row = next(reader)
+                writer.writerow(last_row)
+                for batch in _batches(reader):
+                    originals = {}
+                    for rule in rules:
+                        for index, column in rule.changes(batch, column_numbers):
+                            if in_place and index not in originals:
+                                originals[index] = list(batch[index])
+                            batch[index][column_numbers[column]] = rule.written_value
+                            changed += 1
+                    #each changed cell is counted once from its original to its final value, since rules can chain
+                    for index, original in originals.items():
+                        for column, number in column_numbers.items():
+                            if original[number] != batch[index][number]:
+                                removed[column][original[number]] += 1
+                                added[column][batch[index][number]] += 1
+                    if in_place and originals:
+                        old_rows.extend(originals.values())
+                        new_rows.extend(batch[index] for index in originals.keys())
+                    writer.writerows(batch)
+                    last_row = batch[-1]
+                    if self.stats.enabled:
+                        self.stats.add_rows("update", len(batch))
+            except BaseException:
+                temp_csv.close()
+                os.remove(temp_csv.name)
+                raise
+        if os.path.isfile(out_file):
+            shutil.copymode(out_file, temp_csv.name)
+        if self.stats.enabled:
+            self.stats.bytes["update"] = self.stats.bytes.get("update", 0) + os.path.getsize(temp_csv.name)
+        os.replace(temp_csv.name, out_file)
+        if in_place:
+            self._update_counts(removed, added)
+            self.relationship_index.replace_rows(old_rows, new_rows)
+            self._rebuild_relationships()
+            #the zone map's byte offsets no longer match the rewritten file
+            self.zone_map = None
+            self._set_scan_state(os.path.getsize(self.file), last_row)
+            if self._cache:
+                self._save_cache(self._cache_hash)
+        return changed
+
+    '''
+    Move the metadata counts of overwritten values to the values that replaced them.
+    Columns with approximate counts are profiled again, and pending columns are left to be profiled when they are used.
+    '''
+    def _update_counts(self, removed:dict, added:dict):
+        columns = [column for column in self.headers.keys() if removed[column] and column not in self.headers.pending]
+        if any(self.headers[column].approximate for column in columns):
+            super()._rescan()
+            return
         for column in columns:
-            if column not in self.headers.keys():
-                print(f"{column} is not a valid column.")
-                return
-        for column in column_value.keys():
-            if column not in self.headers.keys():
-                print(f"{column} is not a valid column.")
+            meta = self.headers[column]
+            values = removed[column]
+            for (value, count), is_number in zip(values.items(), _decimal_mask(list(values.keys()))):
+                if is_number:
+                    meta.remove_quantitative(count)
+                else:
+                    meta.remove_qualitative(value, count)
+            values = added[column]
+            for (value, count), is_number in zip(values.items(), _decimal_mask(list(values.keys()))):
+                if is_number:
+                    meta.add_quantitative(count)
+                else:
+                    meta.add_qualitative(value, count)
+
+    '''
+    Bring the DataFile up to date with its file, profiling only appended rows when possible (see refresh).
+    If new_file is given, reinitialize DataFile to the new file, keeping any relationships that have been run.
+    '''
+    def update_file(self, new_file=None):
+        if new_file is not None and new_file != self.file:
+            if not os.path.isfile(new_file):
+                raise FileNotFoundError(f"{new_file} does not exist.")
+            self.file = new_file
+            self._scan_offset = None
+        self.refresh()
+
+    '''
+    Lazily yield a dictionary for each group of rows that have the same values in the by columns, in one pass over the file.
+    by: column name or list of column names to group by
+    aggregates: dictionary; key is a column name, value is an aggregate function or list of them from AGGREGATES.
+    The values of each column that are numbers (see _convert_string_to_number) are aggregated, and other values, including
+    placeholders such as "-" that look like numbers but can't be converted, are skipped.
+    max_groups: number of groups kept in memory. Once there are more, the partial aggregates are spilled to temporary
+    files partitioned by the hash of their group, and each partition is merged after the scan.
+    Each dictionary has the by columns, "count" (the number of rows in the group) and "function(column)" for each
+    aggregate. mean, min and max are None for groups without numbers. Groups are yielded in the order they first appear
+    in the file unless they were spilled.
+    '''
+    def group_by(self, by, aggregates:dict=None, max_groups:int=GROUP_BY_MAX_GROUPS):
+        by = [by] if isinstance(by, str) else list(by)
+        aggregates = [(column, [functions] if isinstance(functions, str) else list(functions)) for column, functions in (aggregates or {}).items()]
+        for column in by + [column for column, functions in aggregates]:
+            if column not in self.headers:
+                raise ValueError(f"{column} is not a valid column.")
+        for column, functions in aggregates:
+            for function in functions:
+                if function not in AGGREGATES:
+                    raise ValueError(f"{function} is not a valid aggregate. Use one of {', '.join(AGGREGATES)}.")
+        return self._group_by(by, aggregates, max_groups)
+
+    def _group_by(self, by:list, aggregates:list, max_groups:int):
+        numbers = {meta.name: meta.number for meta in self.headers.metadata()}
+        key_numbers = [numbers[column] for column in by]
+        value_numbers = [numbers[column] for column, functions in aggregates]
+        distinct = ["distinct" in functions for column, functions in aggregates]
+        number_columns = max(key_numbers + value_numbers) + 1
+        table = {}
+        spill_files = None
+        try:
+            with self.stats.timer("group by"), self._open() as f:
+                reader = csv.reader(f, **self._reader_kwargs)
+                next(reader)
+                for batch in _batches(reader):
+                    columns = _batch_columns(batch, number_columns)
+                    keys = zip(*[columns[number] for number in key_numbers])
+                    values = []
+                    for number in value_numbers:
+                        stripped = _convert_to_decimal_strings(columns[number])
+                        mask = _decimal_mask(columns[number], stripped)
+                        values.append((mask, _convert_values(stripped, mask)))
+                    for row, key in enumerate(keys):
+                        state = table.get(key)
+                        if state is None:
+                            if len(table) >= max_groups:
+                                if spill_files is None:
+                                    spill_files = [tempfile.TemporaryFile() for _ in range(SPILL_PARTITIONS)]
+                                _spill(table.items(), spill_files)
+                                table = {}
+                            state = table[key] = _new_group_state(distinct)
+                        state[0] += 1
+                        slot = 1
+                        for mask, converted in values:
+                            if mask[row]:
+                                number = converted[row]
+                                state[slot] += 1
+                                state[slot + 1] += number
+                                if state[slot + 2] is None or number < state[slot + 2]:
+                                    state[slot + 2] = number
+                                if state[slot + 3] is None or number > state[slot + 3]:
+                                    state[slot + 3] = number
+                                if state[slot + 4] is not None:
+                                    state[slot + 4].add(number)
+                            slot += 5
+                    if self.stats.enabled:
+                        self.stats.add_rows("group by", len(batch))
+            if spill_files is None:
+                for key, state in table.items():
+                    yield _group_result(by, aggregates, key, state)
                 return
-        if not os.path.isfile(out_file):
-            new_file = open(out_file,"w")
-            new_file.close()
-        with in_file.open("r") as real_file, tempfile.TemporaryFile(mode="w", dir=in_file.parent, delete=False, newline="\n") as temp_csv:
-            reader = csv.DictReader(real_file)
-            writer = csv.DictWriter(temp_csv, fieldnames = [header for header in self.headers.keys()])
-            writer.writeheader()
-            for row in reader:
-                alter_row = True
-                #check row column values against column_value dict
-                for column, val in column_value.items():
-                    #check actual value against column_value
-                    actual_value = row[column]
-                    if _is_decimal(actual_value):
-                        actual_value = _convert_to_decimal_string(actual_value)
-                    #print(f"Column: {column}\tCurrent Value: {actual_value}\tTest Value:{val}")
-                    if actual_value != val:
-                        alter_row = False
-                        break
-                if alter_row:
-                    #print(row)
-                    for column in columns:
-                        current_value = row[column]
-                        if _is_decimal(current_value):
-                            current_value = _convert_string_to_number(current_value)
-                        #print(f"current_value: {current_value}\told_value: {old_value}\tnew_value: {new_value}")
-                        if current_value == old_value:
-                            row[column] = new_value
-                writer.writerow(row)
-        #close tempfile before using shutil.copyfile
-        _ = shutil.copyfile(temp_csv.name, out_file)
-        os.remove(temp_csv.name)
-
-    '''
-    Reinitialize DataFile to a new file, keeping any relationships that have been run.
-    '''
-    def update_file(new_file):
-        pass
+            _spill(table.items(), spill_files)
+            table = None
+            for spill_file in spill_files:
+                groups = {}
+                for partition in _read_spill(spill_file):
+                    for key, state in partition:
+                        if key in groups:
+                            _merge_group_states(groups[key], state)
+                        else:
+                            groups[key] = state
+                for key, state in groups.items():
+                    yield _group_result(by, aggregates, key, state)
+        finally:
+            for spill_file in spill_files or []:
+                spill_file.close()
+
+    '''
+    Join the rows of another DataFile to the rows of this one that have the same values in the on columns, and write
+    them to a csv file. The DataFile with fewer rows is the build side, which is loaded into a hash table, and the rows
+    of the other are streamed past it. When the build side has more than max_build_rows rows, both sides are split into
+    SPILL_PARTITIONS temporary files by the hash of their keys and each pair of partitions is joined (grace hash join).
+    other: DataFile to join
+    on: column name or list of column names of this file to join on
+    new_file_name: name of the csv file to write, in the directory of this file unless it is an absolute path
+    how: "inner" writes the rows that have a match. "left" also writes the rows of this file without a match, with
+    empty values for the columns of other.
+    right_on: column names of other to join on, if they aren't the same as on
+    right_suffix: added to the headers of other that are also headers of this file
+    **kwargs: passed to DataFile for the written file
+    Keys are compared as strings, and the on columns of other aren't written. Rows are written in the order of this
+    file when it is streamed, and grouped by partition after a grace hash join. Returns a DataFile of the written file.
+    '''
+    def join(self, other, on, new_file_name, how:str="inner", right_on=None, right_suffix:str="_right", max_build_rows:int=JOIN_MAX_BUILD_ROWS, **kwargs):
+        with self.stats.timer("join"):
+            out_file = self._join(other, on, new_file_name, how, right_on, right_suffix, max_build_rows)
+        return DataFile(out_file, **dict(self._reader_kwargs, **kwargs))
+
+    def _join(self, other, on, new_file_name, how:str, right_on, right_suffix:str, max_build_rows:int):
+        on = [on] if isinstance(on, str) else list(on)
+        right_on = on if right_on is None else ([right_on] if isinstance(right_on, str) else list(right_on))
+        if how not in ("inner", "left"):
+            raise ValueError(f"{how} is not a valid join. Use inner or left.")
+        if len(on) != len(right_on):
+            raise ValueError("on and right_on must have the same number of columns.")
+        for column in on:
+            if column not in self.headers:
+                raise ValueError(f"{column} is not a valid column.")
+        for column in right_on:
+            if column not in other.headers:
+                raise ValueError(f"{column} is not a valid column of {other.file}.")
+        out_file = self._output_path(new_file_name, other)
+        left_numbers = {meta.name: meta.number for meta in self.headers.metadata()}
+        right_numbers = {meta.name: meta.number for meta in other.headers.metadata()}
+        right_columns = [name for name in right_numbers.keys() if name not in right_on]
+        headers = list(left_numbers.keys()) + [name + right_suffix if name in left_numbers else name for name in right_columns]
+        left = lambda: _keyed_rows(self, [left_numbers[column] for column in on])
+        right = lambda: _keyed_rows(other, [right_numbers[column] for column in right_on], [right_numbers[column] for column in right_columns])
+        #the row counts come from profiling; a lazy DataFile that hasn't been scanned has none, so its size is compared
+        #and the build side is read until it's known to fit in memory or not
+        if self._number_rows and other._number_rows:
+            build_left = self._number_rows < other._number_rows
+            build_rows = min(self._number_rows, other._number_rows) - 1
+        else:
+            build_left = os.path.getsize(self.file) < os.path.getsize(other.file)
+            build_rows = None
+        build, probe = (left, right) if build_left else (right, left)
+        spill_files = []
+        try:
+            build_side = build()
+            if build_rows is None:
+                buffered = list(islice(build_side, max_build_rows + 1))
+                build_rows = len(buffered)
+                build_side = chain(buffered, build_side)
+            if build_rows <= max_build_rows:
+                partitions = [(build_side, probe())]
+            else:
+                spill_files = [[tempfile.TemporaryFile() for _ in range(SPILL_PARTITIONS)] for side in range(2)]
+                for rows, files in zip((build_side, probe()), spill_files):
+                    for batch in _batches(rows):
+                        _spill(batch, files)
+                partitions = [(chain.from_iterable(_read_spill(build_file)), chain.from_iterable(_read_spill(probe_file)))
+                              for build_file, probe_file in zip(*spill_files)]
+            joined = chain.from_iterable(_hash_join(build_side, probe_side, build_left, how == "left", len(right_columns)) for build_side, probe_side in partitions)
+            rows = self._write_rows(out_file, headers, joined)
+        finally:
+            for f in chain.from_iterable(spill_files):
+                f.close()
+        if self.stats.enabled:
+            self.stats.add_rows("join", rows, os.path.getsize(out_file))
+        return out_file
+
+    '''
+    Write the rows of the file sorted by one or more columns to a csv file and return a DataFile of it. Columns whose
+    datatype is quantitative or both are ordered as numbers (see _convert_string_to_number), with the values that
+    aren't numbers after them, and other columns are ordered as strings. Equal rows keep their order in the file.
+    Runs of run_rows rows are sorted in memory and spilled to temporary files, then merged with a k-way heap merge,
+    in several passes when there are more than SORT_MERGE_RUNS runs.
+    columns: column name or list of column names to sort by
+    new_file_name: name of the csv file to write, in the directory of this file unless it is an absolute path
+    descending: sort from the largest value
+    **kwargs: passed to DataFile for the written file
+    '''
+    def sort(self, columns, new_file_name, descending:bool=False, run_rows:int=SORT_RUN_ROWS, **kwargs):
+        with self.stats.timer("sort"):
+            out_file = self._sort(columns, new_file_name, descending, run_rows)
+        return DataFile(out_file, **dict(self._reader_kwargs, **kwargs))
+
+    def _sort(self, columns, new_file_name, descending:bool, run_rows:int):
+        key_numbers, numeric = self._sort_columns(columns)
+        out_file = self._output_path(new_file_name)
+        headers = [meta.name for meta in self.headers.metadata()]
+        by_key = operator.itemgetter(0)
+        runs = []
+        try:
+            run = []
+            for keys, batch in _key_batches(self, key_numbers, numeric, descending):
+                run.extend(zip(keys, batch))
+                if len(run) >= run_rows:
+                    run.sort(key=by_key, reverse=descending)
+                    runs.append(_write_run(run))
+                    run = []
+            run.sort(key=by_key, reverse=descending)
+            if runs:
+                if run:
+                    runs.append(_write_run(run))
+                run = None
+                while len(runs) > SORT_MERGE_RUNS:
+                    merged = []
+                    for start in range(0, len(runs), SORT_MERGE_RUNS):
+                        group = runs[start:start + SORT_MERGE_RUNS]
+                        merged.append(_write_run(_merge_runs(group, descending)))
+                        for f in group:
+                            f.close()
+                    runs = merged
+                items = _merge_runs(runs, descending)
+            else:
+                items = run
+            rows = self._write_rows(out_file, headers, map(operator.itemgetter(1), items))
+        finally:
+            for f in runs:
+                f.close()
+        if self.stats.enabled:
+            self.stats.add_rows("sort", rows, os.path.getsize(out_file))
+        return out_file
+
+    '''
+    Return the first n rows of the file ordered by one or more columns as sort orders them, as dictionaries of column
+    name to value, in one pass that keeps only n rows in memory.
+    columns: column name or list of column names to order by
+    descending: return the rows with the largest values. Default is True.
+    '''
+    def top_n(self, n:int, columns, descending:bool=True) -> list:
+        key_numbers, numeric = self._sort_columns(columns)
+        headers = [meta.name for meta in self.headers.metadata()]
+        select = heapq.nlargest if descending else heapq.nsmallest
+        with self.stats.timer("top n"):
+            items = chain.from_iterable(zip(keys, batch) for keys, batch in _key_batches(self, key_numbers, numeric, descending))
+            top = select(n, items, key=operator.itemgetter(0))
+        return [dict(zip(headers, row)) for key, row in top]
 
+    '''
+    Return the column numbers of the columns to sort by and whether each is ordered as numbers
+    '''
+    def _sort_columns(self, columns) -> tuple:
+        columns = [columns] if isinstance(columns, str) else list(columns)
+        for column in columns:
+            if column not in self.headers:
+                raise ValueError(f"{column} is not a valid column.")
+        return [self.headers[column].number for column in columns], [self.headers[column].datatype in ("quantitative", "both") for column in columns]
+
+    '''
+    Return the path of a csv file written from this file and others, in the directory of this file unless new_file_name
+    is an absolute path. The path can't be one of the files being read.
+    '''
+    def _output_path(self, new_file_name, *others) -> Path:
+        if self.file is None or any(other.file is None for other in others):
+            raise ValueError("The rows of a DataFile profiled from a stream can't be read again.")
+        out_file = Path(os.path.dirname(self.file)) / new_file_name
+        if out_file.resolve() in [Path(data.file).resolve() for data in (self, *others)]:
+            raise ValueError(f"{out_file} is being read, so it can't be written.")
+        return out_file
+
+    '''
+    Write a header and rows to a csv file in this file's format through a temporary file that replaces it, deleting any
+    metadata cache and column store of the file. Returns the number of rows written.
+    '''
+    def _write_rows(self, out_file:Path, headers:list, rows) -> int:
+        if os.path.isfile(_cache_path(out_file)):
+            os.remove(_cache_path(out_file))
+        shutil.rmtree(_column_store_path(out_file), ignore_errors=True)
+        written = 0
+        with tempfile.NamedTemporaryFile(mode="w", dir=out_file.parent, delete=False, newline="", suffix=".tmp") as temp_csv:
+            try:
+                writer = csv.writer(temp_csv, **self._reader_kwargs)
+                writer.writerow(headers)
+                for batch in _batches(rows):
+                    writer.writerows(batch)
+                    written += len(batch)
+            except BaseException:
+                temp_csv.close()
+                os.remove(temp_csv.name)
+                raise
+        os.replace(temp_csv.name, out_file)
+        return written
+
+'''
+    Profile many files or streams concurrently and return their DataFiles in the same order.
+    At most concurrency sources are profiled at once, on a thread pool unless an executor is given.
+    Threads overlap the reading and decompression of the sources; pass a ProcessPoolExecutor to profile file paths
+    on several cores.
+    **kwargs: passed to DataFile
+'''
+async def profile_many(sources, concurrency:int=8, executor=None, **kwargs) -> list:
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    async def profile(source):
+        async with semaphore:
+            return await loop.run_in_executor(executor, _create_data_file, source, kwargs)
+
+    try:
+        return await asyncio.gather(*[profile(source) for source in sources])
+    finally:
+        if own_executor:
+            executor.shutdown(wait=False)
+'''
+    Create a DataFile from keyword arguments in a dictionary. Runs in an executor.
+'''
+def _create_data_file(source, kwargs:dict):
+    return DataFile(source, **kwargs)
 
 if __name__ == '__main__':
     file_path = os.path.dirname(__file__) + "/Data.csv"
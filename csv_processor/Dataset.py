@@ -0,0 +1,233 @@
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from .DataFile import DataFile, BaseFile, Metadata, Relation, RelationshipIndex, ColumnStore, PROFILE_BATCH_ROWS
+from .Filter import Filter
+'''
+    Profile one shard. Runs in a worker process, so the column store is reopened by the caller.
+'''
+def _profile_shard(path:str, args:tuple, kwargs:dict) -> DataFile:
+    data = DataFile(path, *args, **kwargs)
+    if data.column_store is not None:
+        data.column_store.close()
+        data.column_store = None
+    return data
+'''
+    Return the co-occurrence counts of column pairs in one shard. Runs in a worker process.
+'''
+def _index_shard(data:DataFile, column_pairs:list) -> dict:
+    index = data.build_relationship_index(*column_pairs)
+    return {key: index.pairs[key] for key in column_pairs}
+
+'''
+Class to represent a dataset split into shard csv files with the same headers.
+
+Each shard is profiled as a DataFile, and their Metadata is merged into a single headers dictionary, so the
+dataset can be used like one file: show_metadata, relationships and filters cover every shard.
+
+source: glob pattern, directory, or list of shard paths. Shards are ordered by path.
+pattern: glob pattern of the shards in a directory. Default is "*.csv".
+workers: number of processes used to profile shards and build relationship indexes. Default is 1 (no process pool).
+*args, **kwargs: passed to DataFile for each shard, for example cache, max_distinct, columns or csv format parameters.
+With columns, the merged headers only have the columns that were profiled.
+'''
+class Dataset:
+    def __init__(self, source, *args, pattern:str="*.csv", workers:int=1, **kwargs):
+        self.source = source
+        self._pattern = pattern
+        self._workers = workers
+        self._args = args
+        self._kwargs = kwargs
+        #key: shard path, value: DataFile of the shard
+        self.shards = {}
+        #key: shard path, value: (size, modification time) of the shard when it was profiled
+        self._shard_state = {}
+        #key: column header, value: Metadata merged from every shard
+        self.headers = {}
+        self.relationships = {}
+        self.relationship_index = RelationshipIndex()
+        self._number_rows = 0
+        self.refresh()
+
+    '''
+    Return the sorted list of shard paths in the source
+    '''
+    def _find_shards(self) -> list:
+        if isinstance(self.source, (list, tuple)):
+            paths = list(self.source)
+        elif os.path.isdir(self.source):
+            paths = glob.glob(os.path.join(self.source, self._pattern))
+        else:
+            paths = glob.glob(self.source)
+        paths = sorted(path for path in paths if os.path.isfile(path))
+        if not paths:
+            raise FileNotFoundError(f"No shard files found for {self.source}.")
+        return paths
+
+    '''
+    Return the (size, modification time) of a shard
+    '''
+    @staticmethod
+    def _state(path:str) -> tuple:
+        stat = os.stat(path)
+        return (stat.st_size, stat.st_mtime_ns)
+
+    '''
+    Profile the shards that were added or changed since they were last profiled, drop the shards that were removed,
+    and merge the Metadata again. Returns the list of shards that were profiled.
+    '''
+    def refresh(self) -> list:
+        paths = self._find_shards()
+        removed = set(self.shards.keys()).difference(paths)
+        for path in removed:
+            del self.shards[path]
+            del self._shard_state[path]
+        changed = [path for path in paths if self._shard_state.get(path) != self._state(path)]
+        states = {path: self._state(path) for path in changed}
+        if self._workers > 1 and len(changed) > 1:
+            with ProcessPoolExecutor(max_workers=self._workers) as executor:
+                profiled = list(executor.map(_profile_shard, changed, [self._args] * len(changed), [self._kwargs] * len(changed)))
+            for data in profiled:
+                if self._kwargs.get("columnar"):
+                    data.column_store = ColumnStore.open(data.file, data._reader_kwargs)
+        else:
+            profiled = [DataFile(path, *self._args, **self._kwargs) for path in changed]
+        for path, data in zip(changed, profiled):
+            self.shards[path] = data
+            self._shard_state[path] = states[path]
+        self.shards = {path: self.shards[path] for path in paths}
+        self._merge()
+        if changed or removed:
+            pairs = list(self.relationship_index.pairs.keys())
+            self.relationship_index = RelationshipIndex()
+            self.build_relationship_index(*pairs)
+            self._rebuild_relationships()
+        return changed
+
+    '''
+    Check that every shard has the same headers and merge their Metadata into headers
+    '''
+    def _merge(self):
+        shards = list(self.shards.items())
+        first_path, first = shards[0]
+        expected = list(first.headers.keys())
+        for path, data in shards[1:]:
+            if list(data.headers.keys()) != expected:
+                raise ValueError(f"The headers of {path} don't match the headers of {first_path}: {list(data.headers.keys())} != {expected}.")
+        for header in self.headers.keys():
+            self.__dict__.pop(header.replace(" ", "_"), None)
+        profiled = set.intersection(*[set(meta.name for meta in data.headers.profiled()) for path, data in shards])
+        self.headers = {}
+        for header in expected:
+            if header not in profiled:
+                continue
+            meta = Metadata(header, first.headers[header].number, self._kwargs.get("max_distinct"))
+            for path, data in shards:
+                meta.merge(data.headers[header])
+            self.headers[header] = meta
+            setattr(self, header.replace(" ", "_"), meta)
+        #one header line and the data rows of every shard
+        self._number_rows = sum(data._number_rows - 1 for path, data in shards) + 1
+
+    '''
+    Build the relationship index of column pairs for every shard and merge them. Pairs that are already indexed are
+    not scanned again.
+    '''
+    def build_relationship_index(self, *column_pairs:tuple) -> RelationshipIndex:
+        pairs = [(self.headers[column1], self.headers[column2]) for column1, column2 in column_pairs]
+        added = self.relationship_index.add_pairs(*pairs)
+        if not added:
+            return self.relationship_index
+        shards = list(self.shards.values())
+        if self._workers > 1 and len(shards) > 1 and not self._kwargs.get("columnar"):
+            with ProcessPoolExecutor(max_workers=self._workers) as executor:
+                shard_pairs = list(executor.map(_index_shard, shards, [added] * len(shards)))
+        else:
+            shard_pairs = [_index_shard(data, added) for data in shards]
+        for counts in shard_pairs:
+            for key in added:
+                table = self.relationship_index.pairs[key]
+                for value, related_counts in counts[key].items():
+                    related = table.setdefault(value, {})
+                    for related_value, count in related_counts.items():
+                        related[related_value] = related.get(related_value, 0) + count
+        return self.relationship_index
+
+    '''
+    Return relationship information between two columns across every shard
+    '''
+    def get_relationships(self, column1:str, column2:str) -> dict:
+        index = self.build_relationship_index((column1, column2))
+        for value in self.headers[column1].qualitative_values:
+            self.relationships[value] = Relation(value, self.headers[column1], self.headers[column2], None, index.related(value, column1, column2))
+        return self.relationships
+
+    '''
+    Return Relation between given value in given column with another column across every shard
+    '''
+    def get_relationship(self, value, column1:str, column2:str):
+        index = self.build_relationship_index((column1, column2))
+        relation = Relation(value, self.headers[column1], self.headers[column2], None, index.related(value, column1, column2))
+        self.relationships[value] = relation
+        return relation
+
+    '''
+    Recompute each relationship in self.relationships from the relationship index, dropping values that are no longer in their column
+    '''
+    def _rebuild_relationships(self):
+        for value, relation in list(self.relationships.items()):
+            column = self.headers.get(relation.column_name)
+            if column is None or relation.related_name not in self.headers or value not in column.qualitative_values:
+                del self.relationships[value]
+                continue
+            self.get_relationship(value, relation.column_name, relation.related_name)
+
+    '''
+    Return a DatasetFilter over every shard. See Filter.
+    '''
+    def filter(self, *non_equality_statements, **equality_tests):
+        return DatasetFilter(self, *non_equality_statements, **equality_tests)
+
+    show_metadata = BaseFile.show_metadata
+
+    def __repr__(self):
+        rep = f"Dataset {self.source}: {len(self.shards)} shards; {self._number_rows} rows; {len(self.headers)} columns'\n'Headers:"
+        for header, values in self.headers.items():
+            rep = rep + f"\n<{header}>: {values.__repr__()}"
+        return rep
+
+    def __str__(self):
+        return self.__repr__()
+
+'''
+Class to filter every shard of a Dataset. The statements are compiled once with the datatypes of the merged Metadata,
+so every shard compares a column the same way, and rows are returned in shard order.
+'''
+class DatasetFilter(Filter):
+    def __init__(self, dataset:Dataset, *non_equality_statements, **equality_tests):
+        super().__init__(dataset, *non_equality_statements, **equality_tests)
+        self._shard_filters = []
+        for data in dataset.shards.values():
+            shard_filter = Filter(data, *non_equality_statements, **equality_tests)
+            shard_filter._tests = self._tests
+            self._shard_filters.append(shard_filter)
+
+    '''
+    Yield (first row number, csv rows, mask) for each batch of rows in every shard. Row numbers count the data rows
+    of the dataset from 0, in shard order.
+    '''
+    def _batch_masks(self, batch_size:int=PROFILE_BATCH_ROWS, csv_rows:bool=False):
+        offset = 0
+        for shard_filter in self._shard_filters:
+            rows = 0
+            for first_row, batch, mask in shard_filter._batch_masks(batch_size, csv_rows):
+                rows = first_row + len(mask)
+                yield offset + first_row, batch, mask
+            offset += rows
+
+    '''
+    Lazily yield each row of every shard that passes every statement, as a dictionary of column name to value.
+    '''
+    def rows(self, batch_size:int=PROFILE_BATCH_ROWS):
+        return chain.from_iterable(shard_filter.rows(batch_size) for shard_filter in self._shard_filters)
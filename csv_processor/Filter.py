@@ -1,10 +1,79 @@
-from DataFile import DataFile
+import csv
+import io
+import math
+import os
+import time
+import operator
+from itertools import compress, repeat
+from .DataFile import DataFile, PROFILE_BATCH_ROWS, classify_values, _batches, _timed, _is_decimal, _convert_to_decimal_string
+'''
+Class to compare the values of one column against a test value, compiled once from a filter statement.
+
+Columns whose Metadata.datatype is quantitative or both are compared as numbers when the test value is a number.
+Values in them that aren't numbers fail every test except !=. Other columns are compared as strings.
+'''
+class _Test:
+    def __init__(self, column:str, comparison:str, value, datatype:str):
+        self.column = column
+        self.comparison = comparison
+        self.compare = getattr(operator, Filter.comparators[comparison].strip("_"))
+        self.numeric = False
+        self.value = str(value)
+        if datatype in ("quantitative", "both") and _is_decimal(self.value):
+            try:
+                self.value = float(_convert_to_decimal_string(self.value))
+                self.numeric = True
+            except ValueError:
+                pass
+
+    '''
+    Return a list that is true for each value in a batch of csv values that passes the test
+    '''
+    def mask(self, values:list) -> list:
+        if self.numeric:
+            mask, numbers = classify_values(values)
+            values = [number if is_number else math.nan for number, is_number in zip(numbers, mask)]
+        return list(map(self.compare, values, repeat(self.value)))
+
+    '''
+    Return a list that is true for each row between start and end of a ColumnStore Column that passes the test.
+    String tests are run once per distinct value and looked up by code.
+    '''
+    def mask_column(self, column, start:int, end:int) -> list:
+        if self.numeric:
+            numbers = column.numbers[start:end] if column.numbers is not None else repeat(math.nan, end - start)
+            return list(map(self.compare, numbers, repeat(self.value)))
+        results = [self.compare(value, self.value) for value in column.dictionary]
+        return list(map(results.__getitem__, column.codes[start:end]))
+
+    '''
+    Return false if no value in a block with the given ZoneMap statistics can pass the test
+    '''
+    def may_match(self, minimum, maximum, nulls:int) -> bool:
+        if self.comparison == "!=":
+            return not (minimum == maximum == self.value and nulls == 0)
+        if minimum is None:
+            return False
+        if self.comparison in (">=", ">"):
+            return self.compare(maximum, self.value)
+        if self.comparison in ("<=", "<"):
+            return self.compare(minimum, self.value)
+        return minimum <= self.value <= maximum
+
+    def __repr__(self):
+        return f"<Test {self.column}{self.comparison}{self.value!r}> {'numeric' if self.numeric else 'string'}"
+
 '''
 Class to return filtered data from a DataFile
 
 *non_equality_statements: string that outlines a single test to perform. For example, "Year>=2000".
 Not regex supported.
 **equality_tests: key is the name of a column, value is the value to test for equality
+
+Statements are compiled once into typed tests using the datatype of each column. Rows are streamed from the
+csv file in batches, or read from the DataFile's ColumnStore when it has the tested columns, so filtering a
+large file runs in constant memory. When the DataFile has a ZoneMap, blocks of the csv file whose statistics
+show they can't pass a numeric test are skipped without being read.
 '''
 class Filter:
     comparators = {
@@ -14,37 +83,195 @@ class Filter:
         "==": "__eq__",
         ">" : "__gt__",
         "<" : "__lt__",
-        "!=": "__eq__"
+        "!=": "__ne__"
     }
     def __init__(self, data:DataFile, *non_equality_statements, **equality_tests):
         self.file = data
         #list of tuples. tuple data is (column name, operator, value) and is used to create tests.
         self.statements = []
+        self._handle_args(*non_equality_statements)
+        self._handle_kwargs(**equality_tests)
+        self._tests = self._compile()
+
     '''
-    Run an individual test.
-    TODO: determine types and type casting
+    Compile self.statements into tests, checking that their columns and operators are valid.
     '''
-    def _run_test(self, row_value, test, test_value):
-        test = getattr(row_value, test)
-        return test(test_value)
+    def _compile(self) -> list:
+        tests = []
+        for column, comparison, value in self.statements:
+            if column not in self.file.headers:
+                raise ValueError(f"{column} is not a valid column.")
+            if comparison not in Filter.comparators:
+                raise ValueError(f"{comparison} is not a valid operator.")
+            tests.append(_Test(column, comparison, value, self.file.headers[column].datatype))
+        return tests
+
     '''
     Conduct all the statements on a row. Return true if they all pass.
     '''
     def _test_row(self, row):
-        try:
-            for statement in self.statements:
-                row_value = row[statement[0]]
-                test = Filter.comparators[statement[1]]
-                test_val = statement[2]
-                result = self._run_test(row_value, test, test_val)
-                if "!" in statement[1] and result:
-                    return False
-                if not result:
-                    return False
-            return True
-        except Exception:
+        return self._test_rows([row])[0]
+
+    '''
+    Conduct all the statements on a batch of rows. Return a list that is true for each row that passes them all.
+    '''
+    def _test_rows(self, rows:list) -> list:
+        return self._mask_columns({test.column: [row[test.column] for row in rows] for test in self._tests}, len(rows))
+
+    '''
+    Return the mask of a batch of rows given as a dictionary of column name to the batch's values
+    '''
+    def _mask_columns(self, columns:dict, size:int) -> list:
+        if not self._tests:
+            raise ValueError("No statements have been provided.")
+        mask = [True] * size
+        for test in self._tests:
+            mask = list(map(operator.and_, mask, test.mask(columns[test.column])))
+        return mask
+
+    '''
+    Return true if every column used by the statements (or every column, if all_columns) is in the column store
+    '''
+    def _use_column_store(self, all_columns:bool=False) -> bool:
+        store = self.file.column_store
+        if store is None:
+            return False
+        columns = self.file.headers.keys() if all_columns else [test.column for test in self._tests]
+        return all(column in store for column in columns)
+
+    '''
+    Yield (first row number, csv rows, mask) for each batch of rows in the file. Row numbers count data rows from 0.
+    The csv rows are None when the batch was read from the column store.
+    When the DataFile's stats are enabled, reading batches is timed as the "filter read" stage and testing them as "filter".
+    '''
+    def _batch_masks(self, batch_size:int=PROFILE_BATCH_ROWS, csv_rows:bool=False):
+        stats = self.file.stats.active()
+        for first_row, batch, mask in self._timed_batch_masks(batch_size, csv_rows, stats):
+            if stats is not None:
+                stats.add_rows("filter", len(mask))
+            yield first_row, batch, mask
+
+    def _timed_batch_masks(self, batch_size:int, csv_rows:bool, stats):
+        if not self._tests:
             raise ValueError("No statements have been provided.")
-        
+        if not csv_rows and self._use_column_store():
+            store = self.file.column_store
+            for start in range(0, store.rows, batch_size):
+                if stats is not None:
+                    started = time.perf_counter()
+                end = min(start + batch_size, store.rows)
+                mask = [True] * (end - start)
+                for test in self._tests:
+                    mask = list(map(operator.and_, mask, test.mask_column(store.column(test.column), start, end)))
+                if stats is not None:
+                    stats.add_time("filter", time.perf_counter() - started)
+                yield start, None, mask
+            return
+        numbers = [(test.column, self.file.headers[test.column].number) for test in self._tests]
+        if self.file.zone_map is not None and self.file.zone_map.blocks:
+            batches = self._zone_batches()
+        else:
+            batches = ((None, batch) for batch in self._csv_batches(batch_size))
+        if stats is not None:
+            batches = _timed(batches, stats, "filter read")
+        first_row = 0
+        for block, batch in batches:
+            if batch is None:
+                yield first_row, None, [False] * block[3]
+                first_row += block[3]
+                continue
+            if stats is not None:
+                started = time.perf_counter()
+            mask = self._mask_columns({column: [row[number] for row in batch] for column, number in numbers}, len(batch))
+            if stats is not None:
+                stats.add_time("filter", time.perf_counter() - started)
+            yield first_row, batch, mask
+            first_row += len(batch)
+
+    '''
+    Return a list that is true for each block of the DataFile's ZoneMap that may have rows passing every numeric test
+    '''
+    def _candidate_blocks(self) -> list:
+        zone_map = self.file.zone_map
+        candidates = [True] * len(zone_map.blocks)
+        for test in self._tests:
+            if test.numeric and test.column in zone_map.columns:
+                candidates = [candidate and test.may_match(*stats) for candidate, stats in zip(candidates, zone_map.columns[test.column])]
+        return candidates
+
+    '''
+    Yield (block, csv rows) for each block of the DataFile's ZoneMap, with None for the rows of skipped blocks,
+    then (None, csv rows) for any rows added to the file after the last block.
+    '''
+    def _zone_batches(self):
+        zone_map = self.file.zone_map
+        kwargs = self.file._reader_kwargs
+        with open(self.file.file, "rb") as f:
+            for block, candidate in zip(zone_map.blocks, self._candidate_blocks()):
+                if not candidate:
+                    yield block, None
+                    continue
+                f.seek(block[0])
+                yield block, list(csv.reader(io.TextIOWrapper(io.BytesIO(f.read(block[1] - block[0]))), **kwargs))
+            end = zone_map.end()
+            if end < os.fstat(f.fileno()).st_size:
+                f.seek(end)
+                reader = csv.reader(io.TextIOWrapper(io.BytesIO(f.read())), **kwargs)
+                for batch in _batches(reader, zone_map.block_rows):
+                    yield None, batch
+
+    '''
+    Yield batches of csv rows from the file, without the header
+    '''
+    def _csv_batches(self, batch_size:int):
+        with self.file._open() as f:
+            reader = csv.reader(f, **self.file._reader_kwargs)
+            next(reader)
+            yield from _batches(reader, batch_size)
+
+    '''
+    Yield a boolean mask for each batch of batch_size rows, true for each row that passes every statement.
+    Batches are one ZoneMap block long when the DataFile has one.
+    '''
+    def masks(self, batch_size:int=PROFILE_BATCH_ROWS):
+        for first_row, batch, mask in self._batch_masks(batch_size):
+            yield mask
+
+    '''
+    Lazily yield each row that passes every statement, as a dictionary of column name to value.
+    '''
+    def rows(self, batch_size:int=PROFILE_BATCH_ROWS):
+        header_list = list(self.file.headers.keys())
+        if self._use_column_store(all_columns=True):
+            columns = [self.file.column_store.column(header) for header in header_list]
+            for first_row, batch, mask in self._batch_masks(batch_size):
+                for index in compress(range(first_row, first_row + len(mask)), mask):
+                    yield dict(zip(header_list, [column[index] for column in columns]))
+            return
+        for first_row, batch, mask in self._batch_masks(batch_size, csv_rows=True):
+            if batch is None:
+                continue
+            for row in compress(batch, mask):
+                yield dict(zip(header_list, row))
+
+    def __iter__(self):
+        return self.rows()
+
+    '''
+    Return the number of rows that pass every statement. The count is kept in the DataFile's query cache, if it has one.
+    '''
+    def count(self) -> int:
+        query_cache = getattr(self.file, "query_cache", None)
+        if query_cache is None:
+            return self._count()
+        self.file._check_file_changed()
+        columns = tuple(sorted(set(test.column for test in self._tests)))
+        statements = tuple((column, comparison, str(value)) for column, comparison, value in self.statements)
+        return query_cache.get(("count", columns, statements, self.file._version), self._count)
+
+    def _count(self) -> int:
+        return sum(sum(mask) for mask in self.masks())
+
     '''
     Load equality_tests as tuples into self.statements
     '''
@@ -1,15 +1,17 @@
-import datetime as dt
 import os
+import time
 from DataFile import DataFile
 
+'''
+Print the average and spread of the run time of repetitions calls to method.
+See Benchmark for the benchmark suite with synthetic files and json results.
+'''
 def report_time(method, repititions, *args, **kwargs):
     times = []
     for rep in range(repititions):
-        start = dt.datetime.now()
+        start = time.perf_counter()
         method(*args, **kwargs)
-        end = dt.datetime.now()
-        runtime = end - start
-        times.append(runtime.total_seconds())
+        times.append(time.perf_counter() - start)
     report = f'''
             Function call:  {method.__name__}
             Args:           {args}
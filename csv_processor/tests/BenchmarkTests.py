@@ -0,0 +1,22 @@
+import csv
+from ..Benchmark import generate_csv, compare, run
+from ..DataFile import DataFile
+
+def test_generate_csv(tmp_path):
+    test_file = str(tmp_path / "generated.csv")
+    headers = generate_csv(test_file, 50, columns=4, cardinality=3, missing_rate=0, formats=("currency",))
+    assert(headers == ["Category 0", "Category 1", "Amount 0", "Amount 1"])
+    data = DataFile(test_file)
+    assert(data._number_rows == 51)
+    assert(len(data.headers["Category 0"].qualitative_values) <= 3)
+    assert(data.headers["Amount 0"].datatype == "quantitative")
+    with open(test_file, "r") as f:
+        rows = list(csv.reader(f))
+    assert(all(row[2].startswith("$") for row in rows[1:]))
+
+def test_run_and_compare(tmp_path):
+    results = run(str(tmp_path), 100, repetitions=1)
+    assert(set(results["results"].keys()) == {"construction", "get_relationships", "update_value", "filter"})
+    assert(compare(results, results) == [])
+    baseline = {"results": {"filter": dict(results["results"]["filter"], min=results["results"]["filter"]["min"] / 2)}}
+    assert([regression.split()[0] for regression in compare(results, baseline)] == ["filter"])
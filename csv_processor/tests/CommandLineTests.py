@@ -0,0 +1,38 @@
+import pytest
+import json
+import os
+from ..CommandLine import main, expand_paths
+from .DataFileTests import create_simple_csv
+
+def test_expand_paths(tmp_path):
+    for name in ("b.csv", "a.csv"):
+        create_simple_csv(str(tmp_path / name))
+    paths = expand_paths([str(tmp_path / "*.csv"), str(tmp_path / "a.csv"), str(tmp_path / "missing.csv")])
+    assert(paths == [str(tmp_path / "a.csv"), str(tmp_path / "b.csv"), str(tmp_path / "missing.csv")])
+
+def test_profile_command(tmp_path, capsys):
+    for name in ("a.csv", "b.csv"):
+        create_simple_csv(str(tmp_path / name))
+    checkpoint = str(tmp_path / "checkpoint.jsonl")
+    args = ["profile", str(tmp_path / "*.csv"), str(tmp_path / "missing.csv"), "--columns", "Manufacturer", "Cost", "--checkpoint", checkpoint]
+    assert(main(args) == 1)
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert([os.path.basename(line["file"]) for line in lines] == ["a.csv", "b.csv", "missing.csv"])
+    assert([header["name"] for header in lines[0]["headers"]] == ["Manufacturer", "Cost"])
+    assert(lines[0]["rows"] == 4 and lines[0]["headers"][0]["qualitative_values"] == {"Toyota": 2, "Volkswagon": 1, "Ferrari": 1})
+    assert("error" in lines[2])
+    #the files in the checkpoint are skipped until they change
+    with open(tmp_path / "b.csv", "a") as f:
+        f.write("Toyota,Prius,Blue,\"10,000\",50.1,\"$25,000\"\n")
+    assert(main(["profile", str(tmp_path / "*.csv"), "--checkpoint", checkpoint, "--jobs", "2"]) == 0)
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert([os.path.basename(line["file"]) for line in lines] == ["b.csv"])
+    assert(lines[0]["rows"] == 5)
+
+def test_sample_and_columns_are_rejected(tmp_path, capsys):
+    create_simple_csv(str(tmp_path / "a.csv"))
+    with pytest.raises(SystemExit) as exit_info:
+        main(["profile", str(tmp_path / "a.csv"), "--sample", "10", "--columns", "Cost"])
+    assert(exit_info.value.code == 2)
+    captured = capsys.readouterr()
+    assert(captured.out == "" and "--sample can't be combined with --columns" in captured.err)
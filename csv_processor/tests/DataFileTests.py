@@ -1,9 +1,13 @@
 import pytest
+import asyncio
 import csv
+import gzip
+import io
 import mock
 from unittest.mock import patch
 import os
-from ..DataFile import Metadata, DataFile, Relation, _convert_string_to_number
+from .. import DataFile as data_file_module
+from ..DataFile import Metadata, DataFile, Relation, SpaceSaving, HyperLogLog, Stats, profile_many, _convert_string_to_number, _is_decimal, classify_values
 
 MANUFACTURER_VALUES = {"Toyota": 2, "Volkswagon": 1, "Ferrari": 1}
 MODEL_VALUES = {"Camry": 1, "GTI": 1, "Corolla": 1, "Dino 246 GT": 1}
@@ -172,5 +176,453 @@ def test_update_column_value_kwargs(update_miles_csv):
     os.remove("../test_data/" + destination_file)
     os.remove("../test_data/simple.csv")
 
+def test_get_relationships_from_index(mocker, simple_csv):
+    mocker.patch('builtins.open', simple_csv)
+    test_file = DataFile("../test_data/Data.csv")
+    relationships = test_file.get_relationships("Manufacturer", "Model")
+
+    assert(relationships["Toyota"].related_values == {"Camry", "Corolla"})
+    assert(relationships["Toyota"].related_counts == {"Camry": 1, "Corolla": 1})
+    assert(relationships["Toyota"].type == "one to 2")
+    assert(relationships["Ferrari"].related_values == {"Dino 246 GT"})
+    assert(relationships["Toyota"] == Relation("Toyota", test_file.Manufacturer, test_file.Model, "../test_data/Data.csv"))
+
+def test_build_relationship_index_multiple_pairs(mocker, simple_csv):
+    mocker.patch('builtins.open', simple_csv)
+    test_file = DataFile("../test_data/Data.csv")
+    index = test_file.build_relationship_index(("Manufacturer", "Color"), ("Manufacturer", "Miles"))
+
+    assert(("Manufacturer", "Color") in index)
+    assert(index.related("Toyota", "Manufacturer", "Color") == {"Gray": 1, "Black": 1})
+    assert(index.related("Volkswagon", "Manufacturer", "Miles") == {"75,000": 1})
+    assert(test_file.get_relationship("Toyota", "Manufacturer", "Color").type == "one to 2")
+
+def test_parallel_profile_matches_serial(monkeypatch, tmp_path):
+    test_file = str(tmp_path / "simple.csv")
+    create_simple_csv(test_file)
+    with open(test_file, "a", newline="") as f:
+        writer = csv.writer(f)
+        for row in range(200):
+            writer.writerow(["Mazda", f"Model\n{row % 7}", "Blue", f"{row:,}", "31.5", "N.A." if row % 3 else f"${row}"])
+    monkeypatch.setattr("csv_processor.DataFile.PARALLEL_MIN_BYTES", 0)
+    monkeypatch.setattr("csv_processor.DataFile.PARALLEL_CHUNK_BYTES", 512)
+    serial_file = DataFile(test_file)
+    parallel_file = DataFile(test_file, workers=3)
+
+    assert(serial_file == parallel_file)
+    assert(serial_file.show_metadata() == parallel_file.show_metadata())
+    assert(serial_file._number_rows == parallel_file._number_rows)
+
+def test_parallel_profile_with_stray_quote(monkeypatch, tmp_path):
+    test_file = str(tmp_path / "simple.csv")
+    create_simple_csv(test_file)
+    with open(test_file, "a", newline="") as f:
+        f.write('Sony,5" screen,Black,10,1.5,$100\n')
+        writer = csv.writer(f)
+        for row in range(200):
+            writer.writerow(["Mazda", f"Model\n{row % 7}", "Blue", f"{row:,}", "31.5", "N.A." if row % 3 else f"${row}"])
+    monkeypatch.setattr("csv_processor.DataFile.PARALLEL_MIN_BYTES", 0)
+    monkeypatch.setattr("csv_processor.DataFile.PARALLEL_CHUNK_BYTES", 512)
+    serial_file = DataFile(test_file)
+    parallel_file = DataFile(test_file, workers=3)
+
+    assert(serial_file == parallel_file)
+    assert(serial_file._number_rows == parallel_file._number_rows)
+
+def test_classify_values_matches_per_value_conversion():
+    values = COST_QUANT_VALUES + list(COST_QUAL_VALUES.keys()) + ["25.4", "-3", "Camry", ""]
+    mask, numbers = classify_values(values)
+
+    assert(list(mask) == [_is_decimal(value) for value in values])
+    for value, is_number, number in zip(values, mask, numbers):
+        if is_number:
+            assert(number == _convert_string_to_number(value))
+        else:
+            assert(number == 0)
+    #placeholders that look like numbers but can't be converted are not numbers
+    mask, numbers = classify_values(["1", "-", "2020-01"])
+    assert(list(mask) == [True, False, False])
+    assert(list(numbers) == [1, 0, 0])
+
+def test_metadata_cache(mocker, tmp_path):
+    test_file = str(tmp_path / "simple.csv")
+    create_simple_csv(test_file)
+    profiled_file = DataFile(test_file, cache=True)
+    assert(os.path.isfile(test_file + ".metadata.json"))
+
+    profile = mocker.patch.object(DataFile, "_profile")
+    cached_file = DataFile(test_file, cache=True)
+    assert(not profile.called)
+    assert(cached_file == profiled_file)
+    assert(cached_file._number_rows == profiled_file._number_rows)
+    assert(run_metadata_asserts(cached_file.Cost, 5, "Cost", {"N.A.": 1}, 3, "both"))
+
+    cached_file.invalidate_cache()
+    assert(not os.path.isfile(test_file + ".metadata.json"))
 
+def test_metadata_cache_changed_file(tmp_path):
+    test_file = str(tmp_path / "simple.csv")
+    create_simple_csv(test_file)
+    DataFile(test_file, cache=True, cache_hash=True)
+    with open(test_file, "a", newline="") as f:
+        csv.writer(f).writerow(["Honda", "Civic", "Blue", "1,000", "35.1", "$22,000"])
+    changed_file = DataFile(test_file, cache=True, cache_hash=True)
+
+    assert(run_metadata_asserts(changed_file.Manufacturer, 0, "Manufacturer", {**MANUFACTURER_VALUES, "Honda": 1}, 0, "qualitative"))
+
+def test_metadata_cache_without_zone_map(tmp_path):
+    test_file = str(tmp_path / "simple.csv")
+    create_simple_csv(test_file)
+    DataFile(test_file, cache=True, lazy=True)
+    zoned_file = DataFile(test_file, cache=True, zone_map_rows=2)
+
+    assert(zoned_file.zone_map is not None)
+    assert(not zoned_file.headers.pending)
+    assert(zoned_file._number_rows == 5)
+    assert(zoned_file == DataFile(test_file))
+
+def test_refresh_appended_rows(mocker, tmp_path):
+    test_file = str(tmp_path / "simple.csv")
+    create_simple_csv(test_file)
+    data_file = DataFile(test_file)
+    with open(test_file, "a", newline="") as f:
+        csv.writer(f).writerow(["Honda", "Civic", "Blue", "1,000", "35.1", "$22,000"])
+        f.write('Honda,Fit,"Unfinished')
+    rescan = mocker.spy(data_file, "_rescan")
+    data_file.refresh()
+
+    assert(not rescan.called)
+    assert(run_metadata_asserts(data_file.Manufacturer, 0, "Manufacturer", {**MANUFACTURER_VALUES, "Honda": 1}, 0, "qualitative"))
+    assert(data_file._number_rows == 6)
+
+    with open(test_file, "a", newline="") as f:
+        f.write(' Color",1,30.2,N.A.\n')
+    data_file.refresh()
+    assert(data_file == DataFile(test_file))
+    assert(data_file.Color.qualitative_values["Unfinished Color"] == 1)
 
+def test_refresh_after_stray_quote(tmp_path):
+    test_file = str(tmp_path / "simple.csv")
+    create_simple_csv(test_file)
+    data_file = DataFile(test_file)
+    with open(test_file, "a", newline="") as f:
+        f.write('Sony,5" screen,Black,10,1.5,$100\n')
+        f.write("Honda,Civic,Blue,1,35.1,$22\n")
+    data_file.refresh()
+    assert(data_file._number_rows == 7)
+    assert(data_file == DataFile(test_file))
+
+    with open(test_file, "a", newline="") as f:
+        f.write("Honda,Fit,Red,1,30.2,$18\n")
+    data_file.refresh()
+    assert(data_file._number_rows == 8)
+    assert(data_file == DataFile(test_file))
+
+def test_refresh_rewritten_file(tmp_path):
+    test_file = str(tmp_path / "simple.csv")
+    create_simple_csv(test_file)
+    data_file = DataFile(test_file)
+    with open(test_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Manufacturer", "Model"])
+        writer.writerow(["Honda", "Civic"])
+        writer.writerow(["Honda", "Accord"])
+    data_file.refresh()
+
+    assert(data_file == DataFile(test_file))
+    assert(run_metadata_asserts(data_file.Manufacturer, 0, "Manufacturer", {"Honda": 2}, 0, "qualitative"))
+    assert(not hasattr(data_file, "Cost"))
+
+def test_max_distinct_approximate_columns(mocker, simple_csv):
+    mocker.patch('builtins.open', simple_csv)
+    test_file = DataFile("../test_data/Data.csv", max_distinct=3)
+
+    assert(run_metadata_asserts(test_file.Manufacturer, 0, "Manufacturer", MANUFACTURER_VALUES, 0, "qualitative"))
+    assert(not test_file.Manufacturer.approximate)
+    assert(test_file.Model.approximate)
+    assert(len(test_file.Model.qualitative_values) == 3)
+    assert(test_file.Model.distinct_count() == 4)
+    assert("(approximate)" in test_file.show_metadata("Model"))
+    assert("(approximate)" not in test_file.show_metadata("Manufacturer"))
+
+def test_space_saving_keeps_frequent_values():
+    summary = SpaceSaving(3)
+    distinct = HyperLogLog()
+    for index in range(1000):
+        value = "frequent" if index % 2 else f"rare {index}"
+        summary.add(value)
+        distinct.add(value)
+
+    assert(summary.counts["frequent"] - summary.errors["frequent"] <= 500 <= summary.counts["frequent"])
+    assert(len(summary.counts) == 3)
+    assert(abs(distinct.estimate() - 501) < 25)
+
+def test_column_store(mocker, tmp_path):
+    test_file = str(tmp_path / "simple.csv")
+    create_simple_csv(test_file)
+    data_file = DataFile(test_file, columnar=True)
+    cost = data_file.column_store.column("Cost")
+
+    assert(list(cost) == COST_QUANT_VALUES[:2] + [COST_QUANT_VALUES[2], "N.A."])
+    assert(list(cost.numbers[:3]) == [15000.0, 20000.0, 10000.0])
+    assert(list(data_file.column_store.column("Manufacturer").dictionary) == list(MANUFACTURER_VALUES.keys()))
+
+    reader = mocker.spy(csv, "reader")
+    relationships = DataFile(test_file, columnar=True, cache=True).get_relationships("Manufacturer", "Color")
+    assert(relationships["Toyota"].related_counts == {"Gray": 1, "Black": 1})
+    assert(DataFile(test_file, columnar=True, cache=True).get_relationship("Toyota", "Manufacturer", "Miles").related_values == {"75,000", "100,000"})
+    assert(reader.call_count == 1)
+
+    data_file.invalidate_column_store()
+    assert(not os.path.isdir(test_file + ".columns"))
+
+def test_update_values_in_place(tmp_path):
+    test_file = str(tmp_path / "simple.csv")
+    create_simple_csv(test_file)
+    data_file = DataFile(test_file)
+    data_file.get_relationships("Manufacturer", "Model")
+    rules = [("N.A.", -1, ["Cost"]), (75000, 76000, ["Miles"], {"Model": "Camry"}), ("Toyota", "Lexus", ["Manufacturer"], {"Color": "Black"})]
+    assert(data_file.update_values(rules) == 3)
+    profiled_file = DataFile(test_file)
+    profiled_file.get_relationships("Manufacturer", "Model")
+    assert(data_file.headers == profiled_file.headers)
+    assert(data_file.Cost.datatype == "quantitative")
+    assert(data_file.relationship_index.pairs == profiled_file.relationship_index.pairs)
+    assert(data_file.relationships["Toyota"] == profiled_file.relationships["Toyota"])
+    assert(os.listdir(tmp_path) == ["simple.csv"])
+
+def test_update_values_chained_rules(tmp_path):
+    test_file = str(tmp_path / "simple.csv")
+    create_simple_csv(test_file)
+    data_file = DataFile(test_file, cache=True)
+    data_file.get_relationships("Manufacturer", "Model")
+    assert(data_file.update_values([("Toyota", "Lexus", ["Manufacturer"]), ("Lexus", "Acura", ["Manufacturer"])]) == 4)
+    profiled_file = DataFile(test_file)
+    profiled_file.get_relationships("Manufacturer", "Model")
+    assert(data_file.Manufacturer.qualitative_values == {"Acura": 2, "Volkswagon": 1, "Ferrari": 1})
+    assert(data_file.headers == profiled_file.headers)
+    assert(data_file.relationship_index.pairs == profiled_file.relationship_index.pairs)
+    assert(DataFile(test_file, cache=True).headers == profiled_file.headers)
+
+def test_stats(tmp_path):
+    test_file = str(tmp_path / "simple.csv")
+    create_simple_csv(test_file)
+    events = []
+    stats = Stats(observers=[lambda event, details: events.append((event, details["operation"]))])
+    data_file = DataFile(test_file, stats=stats)
+    assert(set(stats.timers.keys()) == {"tokenize", "classify", "count", "store", "construct"})
+    assert(stats.rows["profile"] == 4)
+    assert(stats.bytes["profile"] == os.path.getsize(test_file))
+    assert(events[0] == ("start", "construct") and events[-1] == ("end", "construct"))
+    data_file.get_relationship("Toyota", "Manufacturer", "Model")
+    assert(stats.rows["relation"] == 4)
+    assert(DataFile(test_file).stats.enabled is False)
+    assert(DataFile(test_file).stats.timers == {})
+
+def test_lazy_and_projected_columns(tmp_path, mocker):
+    test_file = str(tmp_path / "simple.csv")
+    create_simple_csv(test_file)
+    profiled_file = DataFile(test_file)
+    lazy_file = DataFile(test_file, lazy=True)
+    assert(list(lazy_file.headers.keys()) == list(profiled_file.headers.keys()))
+    assert(lazy_file.headers.pending == set(profiled_file.headers.keys()))
+    assert(lazy_file.Cost == profiled_file.Cost)
+    assert(lazy_file.headers.pending == {"Manufacturer", "Model", "Color", "Miles", "MPG"})
+    assert(lazy_file.headers["MPG"] == profiled_file.MPG)
+    classify = mocker.spy(data_file_module, "_decimal_mask")
+    projected_file = DataFile(test_file, columns=["Manufacturer", "Model"])
+    assert(classify.call_count == 2)
+    assert(projected_file.get_relationship("Toyota", "Manufacturer", "Model") == profiled_file.get_relationship("Toyota", "Manufacturer", "Model"))
+    assert(projected_file == profiled_file)
+    with pytest.raises(ValueError):
+        DataFile(test_file, columns=["Year"])
+
+def test_compressed_files_and_streams(tmp_path):
+    test_file = str(tmp_path / "simple.csv")
+    create_simple_csv(test_file)
+    profiled_file = DataFile(test_file)
+    with open(test_file, "rb") as f:
+        data = f.read()
+    with gzip.open(test_file + ".gz", "wb") as f:
+        f.write(data)
+    compressed_file = DataFile(test_file + ".gz")
+    assert(compressed_file.headers == profiled_file.headers)
+    assert(compressed_file.get_relationship("Toyota", "Manufacturer", "Model") == profiled_file.get_relationship("Toyota", "Manufacturer", "Model"))
+    stream = io.BytesIO(data)
+    stream_file = DataFile(stream)
+    assert(stream_file.headers == profiled_file.headers)
+    assert(not stream.closed)
+    with pytest.raises(ValueError):
+        stream_file.get_relationship("Toyota", "Manufacturer", "Model")
+    data_files = asyncio.run(profile_many([test_file + ".gz", io.BytesIO(gzip.compress(data))], concurrency=1, compression="gzip"))
+    assert([data_file.headers for data_file in data_files] == [profiled_file.headers, profiled_file.headers])
+
+def test_sampled_profile_and_upgrade(tmp_path, mocker):
+    test_file = str(tmp_path / "simple.csv")
+    create_simple_csv(test_file)
+    profiled_file = DataFile(test_file)
+    mocker.patch.object(data_file_module, "SAMPLE_BLOCK_BYTES", 40)
+    sampled_file = DataFile(test_file, sample_rows=1, sample_seed=0)
+    assert(sampled_file.sampled)
+    assert(all(meta.sampled for meta in sampled_file.headers.values()))
+    for value, count in sampled_file.Manufacturer.qualitative_values.items():
+        low, high = sampled_file.Manufacturer.intervals[value]
+        assert(low <= count <= high)
+    with pytest.raises(ValueError):
+        sampled_file.update_value("N.A.", -1, "Cost")
+    sampled_file.upgrade_to_exact()
+    assert(not sampled_file.sampled)
+    assert(sampled_file.headers == profiled_file.headers)
+    assert(sampled_file._number_rows == profiled_file._number_rows)
+    #a sample of every block is exact
+    assert(DataFile(test_file, sample_rows=100).headers == profiled_file.headers)
+
+def test_values_are_interned(tmp_path):
+    test_file = str(tmp_path / "simple.csv")
+    create_simple_csv(test_file)
+    test_data = DataFile(test_file)
+    assert(not hasattr(test_data.Manufacturer, "__dict__"))
+    assert(test_data.Manufacturer.qualitative_values == MANUFACTURER_VALUES)
+    toyota = next(value for value in test_data.Manufacturer.qualitative_values if value == "Toyota")
+    assert(toyota is test_data.value_dictionary.intern("Toyota"))
+    relation = test_data.get_relationship("Toyota", "Manufacturer", "Model")
+    assert(relation.related_counts == {"Camry": 1, "Corolla": 1})
+    assert(list(relation._related_codes) == [test_data.value_dictionary.encode("Camry"), test_data.value_dictionary.encode("Corolla")])
+
+def test_group_by(tmp_path):
+    test_file = str(tmp_path / "simple.csv")
+    create_simple_csv(test_file)
+    test_data = DataFile(test_file)
+    groups = list(test_data.group_by("Manufacturer", {"Cost": ["count", "sum", "mean", "min", "max", "distinct"], "MPG": "max"}))
+    assert(groups[0] == {"Manufacturer": "Toyota", "count": 2, "count(Cost)": 2, "sum(Cost)": 25000, "mean(Cost)": 12500,
+                         "min(Cost)": 10000, "max(Cost)": 15000, "distinct(Cost)": 2, "max(MPG)": 28.2})
+    assert(groups[2]["count(Cost)"] == 0 and groups[2]["mean(Cost)"] is None)
+    spilled = list(test_data.group_by(["Manufacturer", "Miles"], {"Cost": "sum"}, max_groups=1))
+    by_key = lambda group: (group["Manufacturer"], group["Miles"])
+    assert(sorted(spilled, key=by_key) == sorted(test_data.group_by(["Manufacturer", "Miles"], {"Cost": "sum"}), key=by_key))
+    with pytest.raises(ValueError):
+        test_data.group_by("Manufacturer", {"Cost": "median"})
+    #a placeholder that looks like a number is skipped instead of failing the whole file
+    placeholder_file = str(tmp_path / "placeholder.csv")
+    with open(placeholder_file, "w") as f:
+        f.write("Name,Amount\nA,5\nA,-\nB,2020-01\nB,3\n")
+    assert(list(DataFile(placeholder_file).group_by("Name", {"Amount": ["count", "sum"]})) == [
+        {"Name": "A", "count": 2, "count(Amount)": 1, "sum(Amount)": 5}, {"Name": "B", "count": 2, "count(Amount)": 1, "sum(Amount)": 3}])
+
+def test_join(tmp_path):
+    test_file = str(tmp_path / "simple.csv")
+    create_simple_csv(test_file)
+    lookup_file = str(tmp_path / "lookup.csv")
+    with open(lookup_file, "w", newline="") as f:
+        csv.writer(f).writerows([["Model", "Color", "Body"], ["Camry", "Silver", "Sedan"], ["GTI", "Red", "Hatchback"]])
+    test_data = DataFile(test_file)
+    joined = test_data.join(DataFile(lookup_file), "Model", "joined.csv")
+    assert(list(joined.headers.keys()) == ["Manufacturer", "Model", "Color", "Miles", "MPG", "Cost", "Color_right", "Body"])
+    assert(joined.Body.qualitative_values == {"Sedan": 1, "Hatchback": 1})
+    left_joined = test_data.join(DataFile(lookup_file), "Model", "left.csv", how="left")
+    assert(left_joined.Model.qualitative_values == MODEL_VALUES)
+    assert(left_joined.Body.qualitative_values == {"Sedan": 1, "Hatchback": 1, "": 2})
+    grace_joined = test_data.join(DataFile(lookup_file), "Model", "grace.csv", how="left", max_build_rows=1)
+    assert(grace_joined.headers == left_joined.headers)
+    with pytest.raises(ValueError):
+        test_data.join(DataFile(lookup_file), "Year", "joined.csv")
+
+def test_join_lazy_files(tmp_path, mocker):
+    test_file = str(tmp_path / "simple.csv")
+    create_simple_csv(test_file)
+    lookup_file = str(tmp_path / "lookup.csv")
+    with open(lookup_file, "w", newline="") as f:
+        csv.writer(f).writerows([["Model", "Body"], ["Camry", "Sedan"], ["GTI", "Hatchback"]])
+    joined = DataFile(test_file).join(DataFile(lookup_file), "Model", "joined.csv")
+    temporary_file = mocker.spy(data_file_module.tempfile, "TemporaryFile")
+    lazy_joined = DataFile(test_file, lazy=True).join(DataFile(lookup_file, lazy=True), "Model", "lazy.csv")
+    assert(not temporary_file.called)
+    assert(lazy_joined.headers == joined.headers)
+    grace_joined = DataFile(test_file, lazy=True).join(DataFile(lookup_file, lazy=True), "Model", "grace.csv", max_build_rows=1)
+    assert(temporary_file.called)
+    assert(grace_joined.Body.qualitative_values == joined.Body.qualitative_values)
+
+def test_sort_and_top_n(tmp_path, mocker):
+    test_file = str(tmp_path / "simple.csv")
+    create_simple_csv(test_file)
+    test_data = DataFile(test_file)
+    sorted_data = test_data.sort("Cost", "sorted.csv")
+    with open(sorted_data.file, "r") as f:
+        assert([row[1] for row in csv.reader(f)] == ["Model", "Corolla", "Camry", "GTI", "Dino 246 GT"])
+    mocker.patch.object(data_file_module, "SORT_MERGE_RUNS", 2)
+    spilled_data = test_data.sort(["Manufacturer", "Miles"], "spilled.csv", descending=True, run_rows=1)
+    with open(spilled_data.file, "r") as f:
+        assert([row[1] for row in csv.reader(f)] == ["Model", "GTI", "Corolla", "Camry", "Dino 246 GT"])
+    assert([row["Model"] for row in test_data.top_n(2, "MPG")] == ["Corolla", "Camry"])
+    assert([row["Model"] for row in test_data.top_n(3, "Cost", descending=False)] == ["Corolla", "Camry", "GTI"])
+    #placeholders that look like numbers sort with the other values that aren't numbers
+    placeholder_file = str(tmp_path / "placeholder.csv")
+    with open(placeholder_file, "w") as f:
+        f.write("Name,Amount\nA,5\nB,-\nC,2020-01\nD,3\n")
+    placeholder_data = DataFile(placeholder_file)
+    with open(placeholder_data.sort("Amount", "placeholder_sorted.csv").file, "r") as f:
+        assert([row[0] for row in csv.reader(f)] == ["Name", "D", "A", "B", "C"])
+    assert([row["Name"] for row in placeholder_data.top_n(2, "Amount")] == ["A", "D"])
+
+def test_fast_path_matches_csv_reader(tmp_path, mocker):
+    test_file = str(tmp_path / "simple.csv")
+    create_simple_csv(test_file)
+    profiled_file = DataFile(test_file)
+    #split the quote free lines of the tiny file instead of parsing the whole block
+    mocker.patch.object(data_file_module, "FAST_PATH_QUOTED_LINES", 1)
+    fast_file = DataFile(test_file, fast_path=True)
+    assert(fast_file.headers == profiled_file.headers)
+    assert((fast_file._number_rows, fast_file._scan_offset, fast_file._scan_last_row) == (profiled_file._number_rows, profiled_file._scan_offset, profiled_file._scan_last_row))
+    assert(DataFile(test_file, fast_path=True, columns=["Model", "Cost"]).headers == DataFile(test_file, columns=["Model", "Cost"]).headers)
+    #a quoted newline falls back to csv.reader
+    newline_file = str(tmp_path / "newline.csv")
+    with open(newline_file, "w", newline="") as f:
+        csv.writer(f).writerows([["Model", "Notes"], ["Camry", "two\nlines"], ["GTI", "one line"]])
+    fast_batches = mocker.spy(data_file_module, "_fast_batches")
+    newline_data = DataFile(newline_file, fast_path=True)
+    assert(fast_batches.call_count == 1)
+    assert(newline_data.Notes.qualitative_values == {"two\nlines": 1, "one line": 1})
+    assert(newline_data._number_rows == DataFile(newline_file)._number_rows)
+    #lines that end in "\r" only fall back to csv.reader too
+    carriage_return_file = str(tmp_path / "carriage_return.csv")
+    with open(carriage_return_file, "w", newline="") as f:
+        f.write('Model,Cost\rCamry,"$15,000"\rGTI,20000\r')
+    carriage_return_data = DataFile(carriage_return_file, fast_path=True)
+    assert(carriage_return_data.headers == DataFile(carriage_return_file).headers)
+    assert(carriage_return_data._number_rows == 3)
+
+def test_fast_path_streams_quoted_blocks(tmp_path, mocker):
+    test_file = str(tmp_path / "quoted.csv")
+    with open(test_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Model", "Notes", "Cost"])
+        for row in range(10):
+            writer.writerow(["Camry", "two\nlines" if row == 5 else f"{row:,}", f"${row * 1000:,}"])
+    profiled_file = DataFile(test_file)
+    profile_rows = mocker.spy(data_file_module, "_profile_rows")
+    fast_file = DataFile(test_file, fast_path=True)
+    #the quoted newline is read by the streamed csv.reader instead of profiling the file again
+    assert(not profile_rows.called)
+    assert(fast_file.headers == profiled_file.headers)
+    assert((fast_file._number_rows, fast_file._scan_offset, fast_file._scan_last_row) == (profiled_file._number_rows, profiled_file._scan_offset, profiled_file._scan_last_row))
+
+def test_query_cache(tmp_path):
+    test_file = str(tmp_path / "simple.csv")
+    create_simple_csv(test_file)
+    test_data = DataFile(test_file, query_cache_size=2)
+    models = test_data.get_relationship("Toyota", "Manufacturer", "Model")
+    colors = test_data.get_relationship("Toyota", "Manufacturer", "Color")
+    assert(test_data.get_relationship("Toyota", "Manufacturer", "Model") is models)
+    assert(colors.related_counts == {"Gray": 1, "Black": 1})
+    assert(test_data.query_cache.info() == {"hits": 1, "misses": 2, "evictions": 0, "entries": 2, "max_entries": 2})
+    assert(test_data.get_relationships("Manufacturer", "Color")["Toyota"] == colors)
+    #the least recently used result was evicted
+    assert(test_data.query_cache.evictions == 1)
+    test_data.get_relationship("Toyota", "Manufacturer", "Model")
+    assert(test_data.query_cache.hits == 2)
+    test_data.update_value("Toyota", "Lexus", "Manufacturer", Model="Camry")
+    assert(test_data.get_relationship("Toyota", "Manufacturer", "Model").related_counts == {"Corolla": 1})
+    #rows appended on disk are picked up by the next query
+    with open(test_file, "a", newline="") as f:
+        csv.writer(f).writerow(["Toyota", "Prius", "Blue", "10,000", "50.1", "$25,000"])
+    assert(test_data.get_relationship("Toyota", "Manufacturer", "Model").related_counts == {"Corolla": 1, "Prius": 1})
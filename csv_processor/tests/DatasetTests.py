@@ -0,0 +1,64 @@
+import csv
+import os
+import pytest
+from ..DataFile import DataFile
+from ..Dataset import Dataset
+from ..Filter import Filter
+from .DataFileTests import create_simple_csv
+
+'''
+Write the simple csv file and two shards that split its rows, and return their paths
+'''
+@pytest.fixture()
+def shards(tmp_path):
+    create_simple_csv(str(tmp_path / "simple.csv"))
+    with open(tmp_path / "simple.csv", "r", newline="") as f:
+        rows = list(csv.reader(f))
+    os.makedirs(tmp_path / "shards")
+    for number, shard_rows in enumerate((rows[1:3], rows[3:])):
+        with open(tmp_path / "shards" / f"part{number}.csv", "w", newline="") as f:
+            csv.writer(f).writerows([rows[0]] + shard_rows)
+    return str(tmp_path / "simple.csv"), str(tmp_path / "shards")
+
+def test_merged_metadata(shards):
+    simple_file, shard_directory = shards
+    data = DataFile(simple_file)
+    dataset = Dataset(shard_directory)
+    assert(list(dataset.shards.keys()) == [os.path.join(shard_directory, "part0.csv"), os.path.join(shard_directory, "part1.csv")])
+    assert(dataset.headers == data.headers)
+    assert(dataset.Cost == data.Cost)
+    assert(dataset.get_relationships("Manufacturer", "Model") == data.get_relationships("Manufacturer", "Model"))
+    for statements in (["Cost>=15000"], ["Manufacturer!=Toyota"]):
+        assert(list(dataset.filter(*statements)) == list(Filter(data, *statements)))
+    assert(dataset.filter("Cost>=15000").count() == 2)
+
+def test_refresh_changed_shards(shards):
+    simple_file, shard_directory = shards
+    dataset = Dataset(os.path.join(shard_directory, "*.csv"))
+    assert(dataset.refresh() == [])
+    with open(os.path.join(shard_directory, "part1.csv"), "a", newline="") as f:
+        csv.writer(f).writerow(["Toyota", "Prius", "Blue", "10,000", "50.0", "$25,000"])
+    assert(dataset.refresh() == [os.path.join(shard_directory, "part1.csv")])
+    assert(dataset.Manufacturer.qualitative_values["Toyota"] == 3)
+    with open(os.path.join(shard_directory, "part2.csv"), "w", newline="") as f:
+        csv.writer(f).writerow(["Manufacturer", "Model"])
+    with pytest.raises(ValueError):
+        dataset.refresh()
+
+def test_refresh_removed_shard(shards):
+    simple_file, shard_directory = shards
+    dataset = Dataset(os.path.join(shard_directory, "*.csv"))
+    dataset.get_relationships("Manufacturer", "Model")
+    os.remove(os.path.join(shard_directory, "part1.csv"))
+    assert(dataset.refresh() == [])
+    assert(dataset.Manufacturer.qualitative_values == {"Toyota": 1, "Volkswagon": 1})
+    assert(dataset.relationships["Toyota"].related_counts == {"Camry": 1})
+
+def test_process_pool_with_columns(shards):
+    simple_file, shard_directory = shards
+    data = DataFile(simple_file)
+    dataset = Dataset(shard_directory, workers=2, columns=["Manufacturer", "Cost"])
+    assert(list(dataset.headers.keys()) == ["Manufacturer", "Cost"])
+    assert(dataset.Manufacturer == data.Manufacturer)
+    assert(dataset.Cost == data.Cost)
+    assert(dataset._number_rows == data._number_rows)
@@ -0,0 +1,78 @@
+import pytest
+from ..DataFile import DataFile
+from ..Filter import Filter
+from .DataFileTests import create_simple_csv
+
+'''
+Return a DataFile for a simple csv file in a temporary directory
+'''
+@pytest.fixture()
+def simple_data(tmp_path):
+    test_file = str(tmp_path / "simple.csv")
+    create_simple_csv(test_file)
+    return DataFile(test_file)
+
+def test_arg_parser():
+    assert(Filter._arg_parser("Year>=2000") == ("Year", ">=", "2000"))
+    assert(Filter._arg_parser("Model!=GTI") == ("Model", "!=", "GTI"))
+
+def test_numeric_comparison(simple_data):
+    #compared as strings, "$15,000" < "$9,000"
+    models = [row["Model"] for row in Filter(simple_data, "Cost<16000")]
+    assert(models == ["Camry", "Corolla"])
+    assert(Filter(simple_data, "MPG>=25")._tests[0].numeric)
+
+def test_not_equal(simple_data):
+    models = [row["Model"] for row in Filter(simple_data, "Manufacturer!=Toyota")]
+    assert(models == ["GTI", "Dino 246 GT"])
+
+def test_equality_tests_and_statements(simple_data):
+    data_filter = Filter(simple_data, "Miles<100000", Manufacturer="Toyota")
+    assert([row["Model"] for row in data_filter] == ["Camry"])
+    assert(data_filter.count() == 1)
+    assert(list(data_filter.masks()) == [[True, False, False, False]])
+
+def test_column_store_matches_csv(simple_data):
+    columnar_data = DataFile(simple_data.file, columnar=True)
+    for statements in (["Cost>=15000"], ["Color>Gray"], ["Cost!=20000", "Model<Dino"]):
+        assert(list(Filter(columnar_data, *statements)) == list(Filter(simple_data, *statements)))
+
+def test_invalid_column(simple_data):
+    with pytest.raises(ValueError):
+        Filter(simple_data, "Year>=2000")
+
+def test_zone_map_skips_blocks(simple_data):
+    zoned_data = DataFile(simple_data.file, zone_map_rows=2)
+    assert(zoned_data.zone_map.columns["MPG"] == [(23.2, 25.4, 0), (18.2, 28.2, 0)])
+    assert(zoned_data.zone_map.columns["Cost"] == [(15000.0, 20000.0, 0), (10000.0, 10000.0, 1)])
+    data_filter = Filter(zoned_data, "Cost>=15000")
+    assert(data_filter._candidate_blocks() == [True, False])
+    for statements in (["Cost>=15000"], ["Cost!=20000", "Miles<100000"], ["Model<Dino"]):
+        assert(list(Filter(zoned_data, *statements)) == list(Filter(simple_data, *statements)))
+    assert(data_filter.count() == 2)
+
+def test_count_is_cached(simple_data):
+    assert(Filter(simple_data, Manufacturer="Toyota").count() == 2)
+    assert(Filter(simple_data, Manufacturer="Toyota").count() == 2)
+    assert((simple_data.query_cache.hits, simple_data.query_cache.misses) == (1, 1))
+    simple_data.update_value("Toyota", "Lexus", "Manufacturer", Model="Camry")
+    assert(Filter(simple_data, Manufacturer="Toyota").count() == 1)
+
+def test_numeric_test_skips_placeholders(tmp_path):
+    test_file = str(tmp_path / "placeholder.csv")
+    with open(test_file, "w") as f:
+        f.write("Model,Cost\nCamry,\"$15,000\"\nGTI,-\nCorolla,2020-01\n")
+    data = DataFile(test_file)
+    assert([row["Model"] for row in Filter(data, "Cost>=0")] == ["Camry"])
+    assert([row["Model"] for row in Filter(data, "Cost!=15000")] == ["GTI", "Corolla"])
+
+def test_zone_map_with_column_profiled_after_refresh(simple_data):
+    zoned_data = DataFile(simple_data.file, zone_map_rows=2, columns=["Manufacturer"])
+    zoned_data.headers["Cost"]
+    with open(zoned_data.file, "a", newline="") as f:
+        f.write("Toyota,Prius,Blue,\"10,000\",50.1,\"$25,000\"\n")
+    zoned_data.refresh()
+    #the blocks before Cost was profiled have no statistics for it, so none are skipped
+    assert("Cost" not in zoned_data.zone_map.columns)
+    assert(Filter(zoned_data, "Cost>=0").count() == 4)
+    assert(Filter(zoned_data, "Manufacturer=Toyota").count() == 3)
@@ -7,9 +7,9 @@ setup(
         author='Devin Duval',
         author_email='DevinDuval09@gmail.com',
         package_dir={'':'.', '.':'.'},
-        packages=[],
+        packages=['csv_processor'],
         package_data={"":['*.csv']},
         include_package_data=True,
         install_requires=[],
-        entry_points={'console_scripts': []},
+        entry_points={'console_scripts': ['csv-processor=csv_processor.CommandLine:main']},
         )
\ No newline at end of file